@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Run from anywhere: the calendar modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Benchmarks always run against the simulated panel, without blocking for refreshes
+os.environ['CALENDAR_EPD_SIM_SPEED'] = '0'
+
+import compositor  # noqa: E402
+import epdsim  # noqa: E402
+import framebuffer  # noqa: E402
+import layout  # noqa: E402
+import render  # noqa: E402
+import storage  # noqa: E402
+import plots  # noqa: E402
+from persistence import PersistenceWorker  # noqa: E402
+from repository import ShadedDaysRepository  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-results')
+YEARS = (2023, 2024)  # Non-leap and leap
+DATASETS = ('empty', 'half', 'full')
+
+
+# Synthetic shaded days: none, every other day, or every day (shapes cycling 1, 2, 3)
+def synthetic_days(year, dataset):
+    days = {}
+    if dataset == 'empty':
+        return days
+    index = 0
+    for (month, day) in layout.get_layout(year, epdsim.EPD_WIDTH, epdsim.EPD_HEIGHT).cells:
+        if dataset == 'full' or index % 2 == 0:
+            days[(month, day)] = index % 3 + 1
+        index += 1
+    return days
+
+
+# Time a callable: median and p95 over the runs (ms), plus peak traced memory of one extra run (KB).
+# Without a setup step the first call is a warm-up and isn't counted.
+def measure(function, repeat, setup=None):
+    if setup is None:
+        function()
+
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    return {'median_ms': statistics.median(samples), 'p95_ms': p95, 'peak_kb': peak / 1024, 'runs': repeat}
+
+
+# Drop the cached layouts and year templates so a run measures the cold path
+def clear_render_caches():
+    layout.get_layout.cache_clear()
+    render.get_base_layer.cache_clear()
+    compositor.get_base_array.cache_clear()
+
+
+def bench_render(results, repeat):
+    for year in YEARS:
+        for dataset in DATASETS:
+            days = synthetic_days(year, dataset)
+
+            def run():
+                render.render_calendar_image(year, epdsim.EPD_WIDTH, epdsim.EPD_HEIGHT, days, 1, (6, 15), (6, 15))
+
+            results[f'render/{year}/{dataset}/warm'] = measure(run, repeat)
+            results[f'render/{year}/{dataset}/cold'] = measure(run, max(1, repeat // 5), setup=clear_render_caches)
+
+            # What ships: a frame from the enabled compositor, and the repaint of the two
+            # cells a ring move touches
+            def run_frame():
+                return compositor.render_frame(year, epdsim.EPD_WIDTH, epdsim.EPD_HEIGHT, days, 1, (6, 15), (6, 15))
+
+            results[f'frame/{year}/{dataset}/warm'] = measure(run_frame, repeat)
+            results[f'frame/{year}/{dataset}/cold'] = measure(run_frame, max(1, repeat // 5), setup=clear_render_caches)
+
+            frame = run_frame()
+            year_layout = layout.get_layout(year, epdsim.EPD_WIDTH, epdsim.EPD_HEIGHT)
+            results[f'repaint/{year}/{dataset}'] = measure(
+                lambda: compositor.repaint_frame(frame, year_layout, [(6, 15), (6, 16)], days, 1, (6, 16), (6, 15)),
+                repeat)
+
+
+def bench_getbuffer(results, repeat):
+    epd = epdsim.EPD()
+    for dataset in DATASETS:
+        image = render.render_calendar_image(2024, epd.width, epd.height, synthetic_days(2024, dataset), 1)
+        results[f'getbuffer/{dataset}'] = measure(lambda: epd.getbuffer(image), repeat)
+        results[f'pack/{dataset}'] = measure(lambda: framebuffer.get_buffer(epd, image), repeat)
+        frame = compositor.render_frame(2024, epd.width, epd.height, synthetic_days(2024, dataset), 1)
+        results[f'pack/frame/{dataset}'] = measure(lambda: framebuffer.get_buffer(epd, frame), repeat)
+
+
+def bench_storage(results, repeat):
+    for store_format in ('text', 'bitset'):
+        storage.STORE_FORMAT = store_format
+        for year in YEARS:
+            for dataset in DATASETS:
+                days = synthetic_days(year, dataset)
+                prefix = f'storage/{store_format}/{year}/{dataset}'
+
+                # Whole-year rewrite (what every toggle used to cost)
+                results[f'{prefix}/save'] = measure(lambda: storage.compact(year, days), repeat)
+                results[f'{prefix}/load'] = measure(lambda: storage.load_year(year), repeat)
+
+                # One toggle as the persistence worker writes it
+                results[f'{prefix}/toggle'] = measure(
+                    lambda: storage.append_changes(year, {(6, 15): 2}), repeat,
+                    setup=lambda: storage.compact(year, days))
+    storage.STORE_FORMAT = 'text'
+
+
+def bench_plot(results, repeat):
+    epd = epdsim.EPD()
+    epd.init()
+    for year in YEARS:
+        for dataset in DATASETS:
+            storage.compact(year, synthetic_days(year, dataset))
+            repository = ShadedDaysRepository(PersistenceWorker())
+            repository.load(year)
+            counts = repository.monthly_counts(year, 1)
+            results[f'plot/{year}/{dataset}/render'] = measure(
+                lambda: plots.render_plot_image(year, 1, counts, epd.width, epd.height), repeat)
+            results[f'plot/{year}/{dataset}/plot_year_data'] = measure(
+                lambda: plots.plot_year_data(epd, repository, year, 1), repeat)
+
+
+# Print the results, with the change against an earlier run when one is given
+def report(results, previous=None):
+    print(f"{'stage':<42} {'median ms':>10} {'p95 ms':>10} {'peak KB':>10}")
+    for name, result in results.items():
+        line = f"{name:<42} {result['median_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['peak_kb']:>10.1f}"
+        if previous and name in previous:
+            before = previous[name]['median_ms']
+            if before > 0:
+                line += f"  ({(result['median_ms'] - before) / before * 100:+.0f}% vs previous)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the calendar render, buffer, storage and plot stages.')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per stage')
+    parser.add_argument('--stages', default='render,getbuffer,storage,plot', help='comma separated stages to run')
+    parser.add_argument('--output', help='where to write the JSON results (default: benchmark-results/<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    stages = args.stages.split(',')
+    results = {}
+    data_dir = tempfile.mkdtemp(prefix='calendar-bench-')
+    storage.DATA_DIR = data_dir
+    try:
+        # Keep the stage output readable
+        sys.stdout, real_stdout = open(os.devnull, 'w'), sys.stdout
+        try:
+            if 'render' in stages:
+                bench_render(results, args.repeat)
+            if 'getbuffer' in stages:
+                bench_getbuffer(results, args.repeat)
+            if 'storage' in stages:
+                bench_storage(results, args.repeat)
+            if 'plot' in stages:
+                bench_plot(results, args.repeat)
+        finally:
+            sys.stdout.close()
+            sys.stdout = real_stdout
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)['results']
+    report(results, previous)
+
+    output = args.output
+    if output is None:
+        if not os.path.exists(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        output = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as file:
+        json.dump({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'repeat': args.repeat,
+            'compositor': 'numpy' if compositor.enabled() else 'pil',
+            'results': results,
+        }, file, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
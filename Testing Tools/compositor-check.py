@@ -0,0 +1,177 @@
+import calendar
+import os
+import random
+import sys
+import time
+
+# Run from anywhere: the calendar modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+import compositor  # noqa: E402
+import framebuffer  # noqa: E402
+from layout import get_layout  # noqa: E402
+from render import render_calendar_image, repaint_cells  # noqa: E402
+
+WIDTH, HEIGHT = 960, 680
+YEARS = (2023, 2024, 2025, 2028, 2031)  # Every weekday for January 1st, leap and non-leap
+
+
+# The original render_calendar draw loop from main.py, kept here as the reference that
+# both the PIL frames (render.py) and the NumPy frames (compositor.py) must match
+def reference_render_calendar(year, shaded_days, current_shape, selected_day=None, today=None):
+    epd_width, epd_height = WIDTH, HEIGHT
+    global_image = Image.new('1', (epd_width, epd_height), 255)
+    draw = ImageDraw.Draw(global_image)
+    font_large = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 24)
+    font_small = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 14)
+
+    draw.text((epd_width // 2 - 50, 10), str(year), font=font_large, fill=0)
+
+    shape_x = epd_width - 180
+    shape_y = 20
+    shape_spacing = 50
+    draw.ellipse([shape_x, shape_y, shape_x + 20, shape_y + 20], fill=0 if current_shape == 1 else None, outline=0)
+    draw.rectangle([shape_x + shape_spacing, shape_y, shape_x + shape_spacing + 20, shape_y + 20], fill=0 if current_shape == 2 else None, outline=0)
+    draw.polygon([shape_x + 2 * shape_spacing, shape_y + 20, shape_x + 2 * shape_spacing + 10, shape_y, shape_x + 2 * shape_spacing + 20, shape_y + 20], fill=0 if current_shape == 3 else None, outline=0)
+
+    weekday_y = 80
+    first_month_y = weekday_y + 40
+    january_start_day, _ = calendar.monthrange(year, 1)
+    start_x = 30
+    day_width = 25
+
+    weekdays = ['M', 'T', 'W', 'T', 'F', 'S', 'S']
+    for i in range(40):
+        day_x = start_x + i * day_width
+        weekday_index = (january_start_day + i) % 7
+        bbox = draw.textbbox((0, 0), weekdays[weekday_index], font=font_small)
+        text_width = bbox[2] - bbox[0]
+        text_x = day_x + (day_width - text_width) // 2
+        draw.text((text_x, weekday_y), weekdays[weekday_index], font=font_small, fill=0)
+
+    for month in range(1, 13):
+        month_name = calendar.month_name[month][:3]
+        month_y = first_month_y + (month - 1) * (30 + 10 + 5)
+        draw.text((5, month_y + (30 // 2)), month_name, font=font_small, fill=0)
+
+        start_day, num_days = calendar.monthrange(year, month)
+        for day in range(1, num_days + 1):
+            day_x = start_x + (start_day + day - 1) * day_width
+            day_y = month_y
+
+            bbox = draw.textbbox((0, 0), str(day).zfill(2), font=font_small)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+            text_x = day_x + (day_width - text_width) // 2
+            text_y = day_y + (30 - text_height) // 2
+
+            shape_diameter = min(20, 30)
+            shape_x = day_x + (day_width - shape_diameter) // 2
+            shape_y = day_y + (30 - shape_diameter) // 2
+
+            if (month, day) == today:
+                draw.line([day_x, day_y + 35, day_x + day_width, day_y + 35], fill=0, width=2)
+
+            if (month, day) == selected_day:
+                if current_shape == 1:
+                    draw.ellipse([shape_x - 3, shape_y - 3, shape_x + shape_diameter + 3, shape_y + shape_diameter + 3], outline=0, width=2)
+                elif current_shape == 2:
+                    draw.rectangle([shape_x - 3, shape_y - 3, shape_x + shape_diameter + 3, shape_y + shape_diameter + 3], outline=0, width=2)
+                elif current_shape == 3:
+                    draw.polygon([shape_x, shape_y + shape_diameter, shape_x + shape_diameter / 2, shape_y,
+                                  shape_x + shape_diameter, shape_y + shape_diameter], outline=0, width=2)
+
+            if (month, day) in shaded_days and shaded_days[(month, day)] == current_shape:
+                if current_shape == 1:
+                    draw.ellipse([shape_x, shape_y, shape_x + shape_diameter, shape_y + shape_diameter], fill=0)
+                elif current_shape == 2:
+                    draw.rectangle([shape_x, shape_y, shape_x + shape_diameter, shape_y + shape_diameter], fill=0)
+                elif current_shape == 3:
+                    draw.polygon([shape_x, shape_y + shape_diameter, shape_x + shape_diameter / 2, shape_y,
+                                  shape_x + shape_diameter, shape_y + shape_diameter], fill=0)
+
+            draw.text((text_x, text_y), str(day).zfill(2), font=font_small, fill=0)
+
+    return global_image
+
+
+def random_state(year, rng, fill):
+    cells = list(get_layout(year, WIDTH, HEIGHT).cells)
+    shaded_days = {day: rng.randint(1, 3) for day in cells if rng.random() < fill}
+    return shaded_days, rng.choice(cells + [None]), rng.choice(cells + [None])
+
+
+# Golden test: frames from render_calendar_image (PIL) and from the NumPy compositor must
+# pack to exactly the bytes of the original render_calendar for the same state
+def check_frames(rng):
+    failures = 0
+    for year in YEARS:
+        for fill in (0.0, 0.3, 1.0):
+            shaded_days, selected_day, today = random_state(year, rng, fill)
+            for shape in (1, 2, 3):
+                golden = framebuffer.pack(reference_render_calendar(year, shaded_days, shape, selected_day, today),
+                                          WIDTH, HEIGHT)
+                image = render_calendar_image(year, WIDTH, HEIGHT, shaded_days, shape, selected_day, today)
+                frame = compositor.compose_frame(year, WIDTH, HEIGHT, shaded_days, shape, selected_day, today)
+                for name, candidate in (('PIL', image), ('NumPy', frame)):
+                    if framebuffer.pack(candidate, WIDTH, HEIGHT) != golden:
+                        print(f"FAIL {name} frame {year} fill {fill} shape {shape}")
+                        failures += 1
+    return failures
+
+
+# Repainting cells in place, on a PIL frame and on an array frame, must give the
+# reference frame for the new state
+def check_repaints(rng, steps=200):
+    failures = 0
+    year = 2024
+    layout = get_layout(year, WIDTH, HEIGHT)
+    cells = list(layout.cells)
+    shaded_days, selected_day, today = random_state(year, rng, 0.3)
+    shape = 1
+    image = render_calendar_image(year, WIDTH, HEIGHT, shaded_days, shape, selected_day, today)
+    frame = compositor.compose_frame(year, WIDTH, HEIGHT, shaded_days, shape, selected_day, today)
+    for step in range(steps):
+        day = rng.choice(cells)
+        if rng.random() < 0.5:
+            shaded_days[day] = rng.randint(1, 3)
+            days = [day]
+        else:
+            days = [day, selected_day] if selected_day else [day]
+            selected_day = day
+        repaint_cells(image, layout, days, shaded_days, shape, selected_day, today)
+        compositor.repaint_cells(frame, layout, days, shaded_days, shape, selected_day, today)
+        golden = framebuffer.pack(reference_render_calendar(year, shaded_days, shape, selected_day, today),
+                                  WIDTH, HEIGHT)
+        for name, candidate in (('PIL', image), ('NumPy', frame)):
+            if framebuffer.pack(candidate, WIDTH, HEIGHT) != golden:
+                print(f"FAIL {name} repaint step {step} {days}")
+                failures += 1
+    return failures
+
+
+def timing(year=2024):
+    shaded_days = {day: 1 for day in get_layout(year, WIDTH, HEIGHT).cells}
+    for name, build in (('PIL', render_calendar_image), ('NumPy', compositor.compose_frame)):
+        build(year, WIDTH, HEIGHT, shaded_days, 1, (1, 1), (1, 2))  # Warm the caches
+        start = time.perf_counter()
+        for _ in range(20):
+            framebuffer.pack(build(year, WIDTH, HEIGHT, shaded_days, 1, (1, 1), (1, 2)), WIDTH, HEIGHT)
+        print(f"{name}: {(time.perf_counter() - start) / 20 * 1000:.2f} ms per packed full-year frame")
+
+
+def main():
+    if framebuffer.np is None:
+        print("NumPy is not installed; the compositor is disabled.")
+        return 0
+    rng = random.Random(25)
+    failures = check_frames(rng) + check_repaints(rng)
+    timing()
+    print("PIL and NumPy frames are pixel-identical to the original render_calendar." if not failures
+          else f"{failures} mismatch(es)!")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import os
+import random
+import sys
+
+# Run from anywhere: the calendar modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw  # noqa: E402
+import epdsim  # noqa: E402
+import framebuffer  # noqa: E402
+import render  # noqa: E402
+
+WIDTH, HEIGHT = epdsim.EPD_WIDTH, epdsim.EPD_HEIGHT
+
+
+# The per-pixel getbuffer of the older Waveshare drivers, kept here as the reference
+def reference_getbuffer(image, width=WIDTH, height=HEIGHT):
+    buf = [0xFF] * (int(width / 8) * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if imwidth == width and imheight == height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * width) / 8)] &= ~(0x80 >> (x % 8))
+    elif imwidth == height and imheight == width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy * width) / 8)] &= ~(0x80 >> (y % 8))
+    return bytes(buf)
+
+
+def random_image(size, seed):
+    rng = random.Random(seed)
+    image = Image.new('1', size, 255)
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle([x, y, x + rng.randrange(1, 60), y + rng.randrange(1, 40)], fill=rng.choice((0, 255)))
+    for _ in range(2000):
+        image.putpixel((rng.randrange(size[0]), rng.randrange(size[1])), rng.choice((0, 255)))
+    return image
+
+
+def check(name, expected, actual):
+    ok = bytes(expected) == bytes(actual)
+    print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def main():
+    ok = True
+    frames = [('calendar', render.render_calendar_image(2024, WIDTH, HEIGHT, {(1, 5): 1, (2, 29): 1}, 1, (3, 1), (3, 2)))]
+    frames += [(f'random {seed}', random_image((WIDTH, HEIGHT), seed)) for seed in range(3)]
+    frames += [(f'random portrait {seed}', random_image((HEIGHT, WIDTH), seed)) for seed in range(2)]
+
+    sim = epdsim.EPD()
+    for name, image in frames:
+        expected = reference_getbuffer(image)
+        ok &= check(f"{name}: pack", expected, framebuffer.pack(image, WIDTH, HEIGHT))
+        ok &= check(f"{name}: simulated driver", expected, sim.getbuffer(image))
+        if framebuffer.np is not None:
+            array = framebuffer.np.asarray(image.convert('L'))
+            ok &= check(f"{name}: pack (uint8 array)", expected, framebuffer.pack(array, WIDTH, HEIGHT))
+
+    # Greyscale frames are converted (dithered) the same way the driver does it
+    grey = Image.effect_noise((WIDTH, HEIGHT), 64)
+    ok &= check("greyscale: pack", sim.getbuffer(grey), framebuffer.pack(grey, WIDTH, HEIGHT))
+
+    # Patching a sub-rectangle of one frame into the buffer of another must give the patched frame's bytes
+    rng = random.Random(7)
+    old, new = frames[1][1], frames[2][1]
+    for _ in range(20):
+        x0, y0 = rng.randrange(WIDTH - 1), rng.randrange(HEIGHT - 1)
+        box = (x0, y0, rng.randrange(x0 + 1, WIDTH + 1), rng.randrange(y0 + 1, HEIGHT + 1))
+        buffer = framebuffer.pack(old, WIDTH, HEIGHT)
+        aligned = framebuffer.update_region(buffer, new, box, WIDTH, HEIGHT)
+        patched = old.copy()
+        patched.paste(new.crop(aligned), aligned[:2])
+        ok &= check(f"region {box} -> {aligned}", reference_getbuffer(patched), buffer)
+
+    print("All buffers identical." if ok else "Buffers differ!")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
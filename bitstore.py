@@ -0,0 +1,148 @@
+import mmap
+import os
+import struct
+import sys
+from datetime import date
+import storage
+
+# Binary store: one fixed-size packed bitset per year in a single memory-mapped file.
+# Bit (day_of_year * SHAPES + shape - 1) is set when that day is shaded with that shape.
+# Every year uses the leap-year day numbering so Feb 29 always has a slot.
+STORE_FILE = 'calendar.bits'
+MAGIC = b'CALBITS1'
+HEADER = struct.Struct('<8sHHH')  # magic, first year, number of years, bytes per year
+HEADER_SIZE = 16
+BASE_YEAR = 2000
+YEAR_COUNT = 200
+SHAPES = 3  # 1 = circle, 2 = square, 3 = triangle
+DAYS = 366
+YEAR_BYTES = (DAYS * SHAPES + 7) // 8
+
+# Day of year (0-365) for every (month, day), and the reverse
+DAY_INDEX = {}
+for _ordinal in range(date(2000, 1, 1).toordinal(), date(2000, 12, 31).toordinal() + 1):
+    _day = date.fromordinal(_ordinal)
+    DAY_INDEX[(_day.month, _day.day)] = len(DAY_INDEX)
+DAY_KEYS = sorted(DAY_INDEX, key=DAY_INDEX.get)
+
+
+# Path of the binary store in the data directory
+def store_path():
+    return os.path.join(storage.DATA_DIR, STORE_FILE)
+
+
+class BitStore:
+    def __init__(self, path=None):
+        self.path = path or store_path()
+        if not os.path.exists(self.path):
+            self._create()
+
+        self.file = open(self.path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, self.base_year, self.year_count, self.year_bytes = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or self.year_bytes != YEAR_BYTES:
+            raise ValueError(f"{self.path} is not a calendar bitset store")
+
+    def _create(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        header = HEADER.pack(MAGIC, BASE_YEAR, YEAR_COUNT, YEAR_BYTES).ljust(HEADER_SIZE, b'\0')
+        with open(self.path, 'wb') as file:
+            file.write(header + bytes(YEAR_COUNT * YEAR_BYTES))
+
+    # True if the year has a slot in the store
+    def covers(self, year):
+        return self.base_year <= year < self.base_year + self.year_count
+
+    def _offset(self, year):
+        if not self.covers(year):
+            raise ValueError(f"Year {year} is outside the store ({self.base_year}-{self.base_year + self.year_count - 1})")
+        return HEADER_SIZE + (year - self.base_year) * self.year_bytes
+
+    # Raw packed bits for one year (a view into the mapped file)
+    def year_slice(self, year):
+        offset = self._offset(year)
+        return memoryview(self.map)[offset:offset + self.year_bytes]
+
+    # True if anything is shaded in the year
+    def has_year(self, year):
+        return any(self.year_slice(year))
+
+    # Decode one year into the {(month, day): shape} dict used everywhere else
+    def load_year(self, year):
+        bits = int.from_bytes(self.year_slice(year), 'little')
+        shaded_days = {}
+        while bits:
+            low = bits & -bits
+            position = low.bit_length() - 1
+            day_index, shape_index = divmod(position, SHAPES)
+            if day_index < DAYS:
+                shaded_days[DAY_KEYS[day_index]] = shape_index + 1
+            bits ^= low
+        return shaded_days
+
+    # Shade a day with one shape (None clears it) by flipping its bits in place
+    def set_day(self, year, month, day, shape):
+        first_bit = DAY_INDEX[(month, day)] * SHAPES
+        offset = self._offset(year)
+        for shape_index in range(SHAPES):
+            bit = first_bit + shape_index
+            byte = offset + bit // 8
+            mask = 1 << (bit % 8)
+            if shape is not None and shape_index == shape - 1:
+                self.map[byte] |= mask
+            else:
+                self.map[byte] &= ~mask & 0xFF
+
+    # Replace a whole year
+    def write_year(self, year, shaded_days):
+        offset = self._offset(year)
+        self.map[offset:offset + self.year_bytes] = bytes(self.year_bytes)
+        for (month, day), shape in shaded_days.items():
+            self.set_day(year, month, day, shape)
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+# Store shared by the rest of the app, opened on first use
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = BitStore()
+    return _store
+
+
+# Convert every {year}.txt (plus its journal) in the data directory into the binary store.
+# Years the store doesn't cover stay in their text files.
+def convert_text_files(data_dir=None, path=None):
+    if data_dir is not None:
+        storage.DATA_DIR = data_dir
+    store = BitStore(path)
+    converted = set()
+    for name in os.listdir(storage.DATA_DIR):
+        year_text, extension = os.path.splitext(name)
+        if extension in ('.txt', '.journal') and year_text.isdigit():
+            converted.add(int(year_text))
+    skipped = sorted(year for year in converted if not store.covers(year))
+    converted = sorted(year for year in converted if store.covers(year))
+    for year in converted:
+        store.write_year(year, storage.load_text_year(year))
+    store.close()
+    print(f"Converted {len(converted)} year(s) into {store.path}: {converted}")
+    if skipped:
+        print(f"Kept {len(skipped)} year(s) outside {store.base_year}-{store.base_year + store.year_count - 1} as text: {skipped}")
+    return converted
+
+
+if __name__ == '__main__':
+    convert_text_files(sys.argv[1] if len(sys.argv) > 1 else None)
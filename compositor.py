@@ -0,0 +1,155 @@
+import os
+from functools import lru_cache
+from PIL import Image, ImageDraw
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: without it frames are painted with PIL
+    np = None
+import render
+from render import get_base_layer, get_shape_stamp, get_shape_options_stamp, boxes_overlap
+from layout import get_layout
+from glyphs import ink_mask, MARGIN
+import metrics
+
+# Frame compositor: 'numpy' builds calendar frames as boolean arrays (True = white),
+# 'pil' paints PIL images with render.py. Both give the same pixels.
+COMPOSITOR = os.environ.get('CALENDAR_COMPOSITOR', 'numpy')
+
+
+def enabled():
+    return COMPOSITOR == 'numpy' and np is not None
+
+
+# A calendar frame with whichever compositor is enabled (an array or a PIL image)
+def render_frame(year, width, height, shaded_days, current_shape, selected_day=None, today=None):
+    if enabled():
+        return compose_frame(year, width, height, shaded_days, current_shape, selected_day, today)
+    return render.render_calendar_image(year, width, height, shaded_days, current_shape, selected_day, today)
+
+
+# Repaint some day cells of a frame made by render_frame, in place; returns the repainted cell boxes
+def repaint_frame(frame, layout, days, shaded_days, current_shape, selected_day=None, today=None):
+    if np is not None and isinstance(frame, np.ndarray):
+        return repaint_cells(frame, layout, days, shaded_days, current_shape, selected_day, today)
+    return render.repaint_cells(frame, layout, days, shaded_days, current_shape, selected_day, today)
+
+
+# The static year template as a read-only array
+@lru_cache(maxsize=render.BASE_LAYER_CACHE_SIZE)
+def get_base_array(year, width, height):
+    array = np.asarray(get_base_layer(year, width, height))
+    array.setflags(write=False)
+    return array
+
+
+# Row and column offsets of the ink pixels of a stamp, relative to its anchor
+def stamp_offsets(stamp):
+    if stamp is None:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    mask, (dx, dy) = stamp
+    rows, columns = np.nonzero(np.asarray(mask))
+    return rows + dy, columns + dx
+
+
+# Ink offsets of a day shape relative to the top left of its shape box
+@lru_cache(maxsize=None)
+def shape_offsets(shape, ring, shape_size, ring_margins):
+    return stamp_offsets(get_shape_stamp(shape, ring, shape_size, ring_margins))
+
+
+@lru_cache(maxsize=None)
+def shape_options_offsets(current_shape):
+    return stamp_offsets(get_shape_options_stamp(current_shape))
+
+
+# Ink offsets of the 2px "today" underline relative to its start point
+@lru_cache(maxsize=None)
+def underline_offsets(length):
+    canvas = Image.new('1', (length + 1 + 2 * MARGIN, 1 + 2 * MARGIN), 255)
+    ImageDraw.Draw(canvas).line((MARGIN, MARGIN, MARGIN + length, MARGIN), fill=0, width=2)
+    return stamp_offsets(ink_mask(canvas, (MARGIN, MARGIN)))
+
+
+# Stamp key of a cell: its shape box size and how far the ring reaches past it
+def cell_geometry(cell):
+    shape_x, shape_y, shape_x_end, shape_y_end = cell.shape_box
+    ring_x, ring_y, ring_x_end, ring_y_end = cell.ring_box
+    return ((shape_x_end - shape_x, shape_y_end - shape_y),
+            (shape_x - ring_x, shape_y - ring_y, ring_x_end - shape_x_end, ring_y_end - shape_y_end))
+
+
+# Blacken the stamp at every anchor (x, y) in one fancy-indexed assignment
+def scatter(frame, anchors, offsets):
+    rows, columns = offsets
+    if not len(anchors) or not len(rows):
+        return
+    height, width = frame.shape
+    anchors = np.asarray(anchors, dtype=np.intp)
+    x, y = anchors[:, 0], anchors[:, 1]
+
+    # Stamps that lie entirely inside the frame are written through flat indices
+    inside = ((x + columns.min() >= 0) & (x + columns.max() < width)
+              & (y + rows.min() >= 0) & (y + rows.max() < height))
+    flat = (y[inside] * width + x[inside])[:, None] + (rows * width + columns)[None, :]
+    frame.reshape(-1)[flat.ravel()] = False
+
+    # Clip the rest pixel by pixel, like PIL does at the edges
+    for anchor_x, anchor_y in anchors[~inside]:
+        stamp_rows, stamp_columns = rows + anchor_y, columns + anchor_x
+        keep = (stamp_rows >= 0) & (stamp_rows < height) & (stamp_columns >= 0) & (stamp_columns < width)
+        frame[stamp_rows[keep], stamp_columns[keep]] = False
+
+
+# Stamp the marks that change between redraws onto a frame array: the shape options,
+# the today underline, the selection ring and every day shaded with the current shape.
+# With `touched`, only marks whose box it accepts are stamped.
+def paint_marks(frame, layout, shaded_days, current_shape, selected_day, today, touched=None):
+    if touched is None or touched(layout.shape_options_box):
+        scatter(frame, [layout.shape_options_origin], shape_options_offsets(current_shape))
+
+    if today in layout.cells and (touched is None or touched(layout.cells[today].box)):
+        x0, y0, x1, _ = layout.cells[today].underline
+        scatter(frame, [(x0, y0)], underline_offsets(x1 - x0))
+
+    if selected_day in layout.cells and (touched is None or touched(layout.cells[selected_day].box)):
+        cell = layout.cells[selected_day]
+        scatter(frame, [cell.shape_box[:2]], shape_offsets(current_shape, True, *cell_geometry(cell)))
+
+    # Shaded days, grouped by stamp (every cell has the same geometry in practice)
+    anchors = {}
+    for day, shape in shaded_days.items():
+        cell = layout.cells.get(day)
+        if shape == current_shape and cell is not None and (touched is None or touched(cell.box)):
+            anchors.setdefault(cell_geometry(cell), []).append(cell.shape_box[:2])
+    for geometry, cell_anchors in anchors.items():
+        scatter(frame, cell_anchors, shape_offsets(current_shape, False, *geometry))
+
+
+# Build a calendar frame as a boolean array, pixel for pixel what render_calendar_image draws
+def compose_frame(year, width, height, shaded_days, current_shape, selected_day=None, today=None):
+    with metrics.span('layout'):
+        layout = get_layout(year, width, height)
+
+    with metrics.span('paint'):
+        frame = get_base_array(year, width, height).copy()
+        paint_marks(frame, layout, shaded_days, current_shape, selected_day, today)
+    return frame
+
+
+# render.repaint_cells for frame arrays
+def repaint_cells(frame, layout, days, shaded_days, current_shape, selected_day=None, today=None):
+    boxes = [layout.cells[day].box for day in days if day in layout.cells]
+    if not boxes:
+        return []
+
+    base = get_base_array(layout.year, layout.width, layout.height)
+    for x0, y0, x1, y1 in boxes:
+        x0, y0 = max(0, x0), max(0, y0)
+        frame[y0:y1, x0:x1] = base[y0:y1, x0:x1]
+
+    def touched(box):
+        return any(boxes_overlap(box, repainted) for repainted in boxes)
+
+    with metrics.span('paint'):
+        paint_marks(frame, layout, shaded_days, current_shape, selected_day, today, touched)
+    return boxes
@@ -0,0 +1,70 @@
+import threading
+from collections import deque
+
+
+# Thread that does all rendering and panel I/O.
+# Frame jobs are latest-state-wins: a frame submitted while another one is waiting
+# replaces it, so the panel only ever catches up to the newest state and the Tk
+# thread never blocks on a refresh. Commands (putting the panel to sleep) are never
+# replaced and run in the order they were submitted relative to the frames.
+class DisplayWorker(threading.Thread):
+    def __init__(self):
+        super().__init__(name='display', daemon=True)
+        self.condition = threading.Condition()
+        self.queue = deque()  # (job, is_frame) waiting to run; at most one frame
+        self.running = False  # A job is being run right now
+        self.stopping = False
+
+    # Queue a frame job (a callable), replacing any frame that hasn't started yet
+    def submit(self, job):
+        with self.condition:
+            queued = [entry for entry in self.queue if entry[1]]
+            if queued:
+                print("Display worker: superseded a queued frame.")
+                self.queue.remove(queued[0])
+            self.queue.append((job, True))
+            self.condition.notify_all()
+
+    # Queue a command (a callable) that must run even if frames are submitted after it
+    def submit_command(self, command):
+        with self.condition:
+            self.queue.append((command, False))
+            self.condition.notify_all()
+
+    # True when there is nothing queued and nothing running
+    def idle(self):
+        with self.condition:
+            return not self.queue and not self.running
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    break
+                job, _ = self.queue.popleft()
+                self.running = True
+
+            try:
+                job()
+            except Exception as e:
+                print(f"Error in display worker: {e}")
+            finally:
+                with self.condition:
+                    self.running = False
+                    self.condition.notify_all()
+
+    # Block until the worker is idle (used at startup and shutdown)
+    def wait_idle(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queue and not self.running, timeout)
+
+    # Finish the job in progress and stop
+    def stop(self, timeout=10):
+        if not self.is_alive():
+            return
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.join(timeout)
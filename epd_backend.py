@@ -0,0 +1,15 @@
+import os
+
+# Which panel driver to use: 'waveshare' for the real 13.3" panel, 'sim' for the simulated
+# one in epdsim.py (headless runs, profiling and benchmarks on a dev box)
+EPD_BACKEND = os.environ.get('CALENDAR_EPD', 'waveshare')
+
+
+# Return the driver module; both provide an EPD class with the same surface
+def load_epd_module(backend=None):
+    backend = backend or EPD_BACKEND
+    if backend == 'sim':
+        import epdsim
+        return epdsim
+    from waveshare_epd import epd13in3k
+    return epd13in3k
@@ -0,0 +1,189 @@
+import os
+import time
+from collections import deque
+from PIL import Image, ImageDraw
+
+# Simulated 13.3" e-paper panel with the same surface as waveshare_epd.epd13in3k.EPD.
+# Every push is recorded, refreshes block for a modelled duration, and frames can be
+# dumped as PNG, so the app can run and be profiled without the physical panel.
+EPD_WIDTH = 960
+EPD_HEIGHT = 680
+
+# Modelled durations in seconds (roughly what the real panel takes)
+INIT_SECONDS = 0.25
+INIT_PART_SECONDS = 0.1
+FULL_REFRESH_SECONDS = 3.5
+PARTIAL_REFRESH_SECONDS = 0.6
+CLEAR_SECONDS = 3.5
+SLEEP_SECONDS = 0.1
+SPI_BYTES_PER_SECOND = 500000  # Transfer cost of sending the buffer to the controller
+
+# Multiply the modelled durations by this when actually blocking (0 = don't block at all)
+TIME_SCALE = float(os.environ.get('CALENDAR_EPD_SIM_SPEED', '1'))
+# Write every pushed frame as a PNG into this directory
+DUMP_DIR = os.environ.get('CALENDAR_EPD_SIM_DUMP')
+# Keep this many of the most recent operations (older ones are folded into the replay base)
+EVENT_HISTORY = int(os.environ.get('CALENDAR_EPD_SIM_HISTORY', '1000'))
+
+
+# One operation performed on the simulated panel
+class PanelEvent:
+    def __init__(self, kind, seconds, region=None, buffer=None):
+        self.kind = kind  # 'init', 'init_Part', 'full', 'partial', 'clear' or 'sleep'
+        self.seconds = seconds  # Modelled duration
+        self.region = region  # (x0, y0, x1, y1) for partial refreshes
+        self.buffer = buffer  # Copy of what was pushed: the whole frame, or only the region's rows for a partial
+        self.timestamp = time.time()
+
+
+class EPD:
+    def __init__(self):
+        self.width = EPD_WIDTH
+        self.height = EPD_HEIGHT
+        self.events = deque()  # The last EVENT_HISTORY operations
+        self.event_count = 0  # Operations recorded so far, including the dropped ones
+        self.ram = bytearray(b'\xff' * (self.width // 8 * self.height))  # What the panel shows
+        self.history_ram = bytearray(self.ram)  # What the panel showed before the oldest kept event
+        self.mode = None
+        self.asleep = True
+        self.dump_dir = DUMP_DIR
+        self.busy_seconds = 0.0  # Refresh time still to wait out in ReadBusy
+
+    # Record an operation: block for the transfer, then wait on the busy line for the refresh
+    def _busy(self, kind, seconds, region=None, buffer=None, transferred=0):
+        event = PanelEvent(kind, seconds, region, bytes(buffer) if buffer is not None else None)
+        if len(self.events) >= EVENT_HISTORY:
+            self._apply(self.history_ram, self.events.popleft())
+        self.events.append(event)
+        self.event_count += 1
+        transfer_seconds = transferred / SPI_BYTES_PER_SECOND
+        if TIME_SCALE > 0:
+            time.sleep(transfer_seconds * TIME_SCALE)
+        self.busy_seconds = seconds - transfer_seconds
+        self.ReadBusy()
+        return event
+
+    def _check_awake(self, operation):
+        if self.asleep:
+            print(f"Simulated EPD: {operation} while the panel is asleep (call init first).")
+
+    def _dump(self, event):
+        if not self.dump_dir:
+            return
+        if not os.path.exists(self.dump_dir):
+            os.makedirs(self.dump_dir)
+        image = self.panel_image().convert('RGB')
+        if event.region:
+            ImageDraw.Draw(image).rectangle([event.region[0], event.region[1],
+                                             event.region[2] - 1, event.region[3] - 1], outline=(255, 0, 0))
+        image.save(os.path.join(self.dump_dir, f'frame_{self.event_count:05d}_{event.kind}.png'))
+
+    def init(self):
+        self.asleep = False
+        self.mode = 'full'
+        self._busy('init', INIT_SECONDS)
+        return 0
+
+    def init_Part(self):
+        self.asleep = False
+        self.mode = 'partial'
+        self._busy('init_Part', INIT_PART_SECONDS)
+        return 0
+
+    # Same conversion as the Waveshare driver: 1-bit, rotated if the image is portrait
+    def getbuffer(self, image):
+        imwidth, imheight = image.size
+        if imwidth == self.width and imheight == self.height:
+            image = image.convert('1')
+        elif imwidth == self.height and imheight == self.width:
+            image = image.rotate(90, expand=True).convert('1')
+        else:
+            print(f"Wrong image dimensions: must be {self.width}x{self.height}")
+            return [0x00] * (self.width // 8 * self.height)
+        return bytearray(image.tobytes('raw'))
+
+    def display(self, image):
+        self._check_awake('display')
+        self.ram[:] = bytes(image)
+        seconds = len(image) / SPI_BYTES_PER_SECOND + FULL_REFRESH_SECONDS
+        self._dump(self._busy('full', seconds, buffer=image, transferred=len(image)))
+
+    def display_Partial(self, image, Xstart, Ystart, Xend, Yend):
+        self._check_awake('display_Partial')
+        if self.mode != 'partial':
+            print("Simulated EPD: display_Partial without init_Part.")
+
+        # The controller works on whole bytes horizontally
+        Xstart = Xstart // 8 * 8
+        Xend = (Xend + 7) // 8 * 8
+        row_bytes = self.width // 8
+        region = bytearray()
+        for y in range(Ystart, Yend):
+            start = y * row_bytes + Xstart // 8
+            end = y * row_bytes + Xend // 8
+            region += image[start:end]
+        self._apply(self.ram, PanelEvent('partial', 0, (Xstart, Ystart, Xend, Yend), region))
+
+        transferred = len(region)
+        seconds = transferred / SPI_BYTES_PER_SECOND + PARTIAL_REFRESH_SECONDS
+        self._dump(self._busy('partial', seconds, (Xstart, Ystart, Xend, Yend), region, transferred))
+
+    def Clear(self):
+        self._check_awake('Clear')
+        self.ram[:] = b'\xff' * len(self.ram)
+        seconds = len(self.ram) / SPI_BYTES_PER_SECOND + CLEAR_SECONDS
+        self._dump(self._busy('clear', seconds, transferred=len(self.ram)))
+
+    def sleep(self):
+        self._busy('sleep', SLEEP_SECONDS)
+        self.asleep = True
+        self.mode = None
+
+    # Wait out the modelled refresh, like polling the panel's busy line
+    def ReadBusy(self):
+        if TIME_SCALE > 0 and self.busy_seconds > 0:
+            time.sleep(self.busy_seconds * TIME_SCALE)
+        self.busy_seconds = 0.0
+
+    # What the panel currently shows
+    def panel_image(self):
+        return Image.frombytes('1', (self.width, self.height), bytes(self.ram))
+
+    # Total modelled time and number of operations per kind
+    def stats(self):
+        summary = {}
+        for event in self.events:
+            count, seconds = summary.get(event.kind, (0, 0.0))
+            summary[event.kind] = (count + 1, seconds + event.seconds)
+        return summary
+
+    # Apply a recorded push to panel memory; returns False for operations that don't change it
+    def _apply(self, ram, event):
+        if event.kind == 'full':
+            ram[:] = event.buffer
+        elif event.kind == 'partial':
+            x0, y0, x1, y1 = event.region
+            row_bytes = self.width // 8
+            region_bytes = (x1 - x0) // 8
+            for row, y in enumerate(range(y0, y1)):
+                start = y * row_bytes + x0 // 8
+                ram[start:start + region_bytes] = event.buffer[row * region_bytes:(row + 1) * region_bytes]
+        elif event.kind == 'clear':
+            ram[:] = b'\xff' * len(ram)
+        else:
+            return False
+        return True
+
+    # Write the panel contents after every kept push as PNG files
+    def dump_frames(self, directory):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        ram = bytearray(self.history_ram)
+        index = 0
+        for event in self.events:
+            if not self._apply(ram, event):
+                continue
+            index += 1
+            Image.frombytes('1', (self.width, self.height), bytes(ram)).save(
+                os.path.join(directory, f'frame_{index:05d}_{event.kind}.png'))
+        return index
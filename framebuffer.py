@@ -0,0 +1,94 @@
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: PIL images are packed without it, arrays need it
+    np = None
+
+# Packs frames into the panel's byte layout without going through the driver's getbuffer.
+# Layout (same as the Waveshare driver): one bit per pixel, rows of width / 8 bytes,
+# the leftmost pixel in the most significant bit, 1 = white and 0 = black.
+# A portrait frame is rotated 90 degrees counter-clockwise first, like the driver does.
+
+
+# True if the frame is the panel's size in either orientation
+def fits(frame, width, height):
+    size = frame_size(frame)
+    return size == (width, height) or size == (height, width)
+
+
+# (width, height) of a PIL image or a NumPy array
+def frame_size(frame):
+    if np is not None and isinstance(frame, np.ndarray):
+        return frame.shape[1], frame.shape[0]
+    return frame.size
+
+
+# Pack a whole frame: a PIL image (any mode, converted like the driver does) or a
+# 2-D array where True / values of 128 and up are white
+def pack(frame, width, height):
+    if np is not None and isinstance(frame, np.ndarray):
+        return bytearray(np.packbits(_panel_array(frame, width, height), axis=1).tobytes())
+
+    if frame.size == (height, width):
+        frame = frame.rotate(90, expand=True)
+    elif frame.size != (width, height):
+        raise ValueError(f"Frame is {frame.size[0]}x{frame.size[1]}, the panel is {width}x{height}")
+    if frame.mode != '1':
+        frame = frame.convert('1')
+    # Mode '1' images are stored in exactly the panel's layout
+    return bytearray(frame.tobytes('raw'))
+
+
+def _panel_array(array, width, height):
+    if array.dtype != np.bool_:
+        array = array >= 128
+    if array.shape == (width, height):
+        array = np.rot90(array)
+    elif array.shape != (height, width):
+        raise ValueError(f"Frame is {array.shape[1]}x{array.shape[0]}, the panel is {width}x{height}")
+    return array
+
+
+# Widen a box (x0, y0, x1, y1) to whole bytes horizontally and clip it to the panel
+def align_box(box, width, height):
+    x0, y0, x1, y1 = box
+    return (max(0, x0 // 8 * 8), max(0, y0), min(width, (x1 + 7) // 8 * 8), min(height, y1))
+
+
+# Pack just a box of a landscape frame; returns the byte-aligned box and its rows of bytes
+def pack_region(frame, box, width, height):
+    x0, y0, x1, y1 = box = align_box(box, width, height)
+    if np is not None and isinstance(frame, np.ndarray):
+        region = _panel_array(frame, width, height)[y0:y1, x0:x1]
+        return box, np.packbits(region, axis=1).tobytes()
+
+    region = frame.crop(box)
+    if region.mode != '1':
+        region = region.convert('1')
+    return box, region.tobytes('raw')
+
+
+# Repack a box of a landscape frame into an existing packed buffer, in place.
+# Returns the byte-aligned box that was written.
+def update_region(buffer, frame, box, width, height):
+    (x0, y0, x1, y1), packed = pack_region(frame, box, width, height)
+    if x1 <= x0 or y1 <= y0:
+        return None
+
+    row_bytes = width // 8
+    region_bytes = (x1 - x0) // 8
+    if np is not None:
+        rows = np.frombuffer(buffer, dtype=np.uint8).reshape(height, row_bytes)
+        rows[y0:y1, x0 // 8:x1 // 8] = np.frombuffer(packed, dtype=np.uint8).reshape(y1 - y0, region_bytes)
+    else:
+        for row in range(y1 - y0):
+            start = (y0 + row) * row_bytes + x0 // 8
+            buffer[start:start + region_bytes] = packed[row * region_bytes:(row + 1) * region_bytes]
+    return (x0, y0, x1, y1)
+
+
+# Pack a frame for the panel: with the packer above when it fits the panel,
+# otherwise leave it to the driver (which reports the wrong size)
+def get_buffer(epd, frame):
+    if fits(frame, epd.width, epd.height):
+        return pack(frame, epd.width, epd.height)
+    return epd.getbuffer(frame)
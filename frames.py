@@ -0,0 +1,114 @@
+from layout import get_layout
+from compositor import render_frame, repaint_frame
+from repository import SHAPES
+import framebuffer
+import metrics
+
+
+# The current year's calendar frame for every shape, each with its packed panel buffer.
+# Switching shape only swaps which frame is pushed; a toggle, a selection move or a
+# new day repaints just the affected cells of the frames they show up in. The shown
+# frame is repainted right away, the others only when they are next used.
+# Lives on the display worker.
+class ShapeFrames:
+    def __init__(self, width, height, getbuffer):
+        self.width = width
+        self.height = height
+        self.getbuffer = getbuffer  # Packs an image into the panel's byte layout
+        self.generation = 0  # Bumped whenever the frames are thrown away (new year)
+        self.year = None
+        self.shaded_days = {}  # Data the frames were drawn from
+        self.selected_day = None
+        self.today = None
+        self.images = {}  # shape -> frame (a NumPy array or a PIL image, see compositor.py)
+        self.buffers = {}  # shape -> packed frame, patched along with the frame
+        self.stale = {}  # shape -> cells to repaint before the frame is used again
+        self.dirty = {}  # shape -> boxes that changed since frame() last handed the frame out
+
+    # Bring the frames up to date with the view state
+    def update(self, year, shaded_days, selected_day, today):
+        if year != self.year:
+            self.images.clear()
+            self.buffers.clear()
+            self.stale.clear()
+            self.dirty.clear()
+            self.generation += 1
+        else:
+            # Cells whose marks differ, per shape: the ring and underline show up in every frame,
+            # a shaded day only in the frames of its old and new shape
+            common = set()
+            if selected_day != self.selected_day:
+                common.update(day for day in (self.selected_day, selected_day) if day is not None)
+            if today != self.today:
+                common.update(day for day in (self.today, today) if day is not None)
+
+            changed = {shape: set(common) for shape in SHAPES}
+            if shaded_days != self.shaded_days:
+                for day in set(shaded_days) | set(self.shaded_days):
+                    old_shape, new_shape = self.shaded_days.get(day), shaded_days.get(day)
+                    if old_shape != new_shape:
+                        for shape in (old_shape, new_shape):
+                            if shape in changed:
+                                changed[shape].add(day)
+
+            for shape in self.images:
+                if changed[shape]:
+                    self.stale.setdefault(shape, set()).update(changed[shape])
+
+        self.year = year
+        self.shaded_days = shaded_days
+        self.selected_day = selected_day
+        self.today = today
+
+    def has(self, shape):
+        return shape in self.images
+
+    # Identifies what a shape's frame is a version of, for RefreshEngine.push_region
+    def source(self, shape):
+        return (id(self), self.generation, shape)
+
+    # Use a frame rendered elsewhere (a prerendered neighbouring year) for the current state
+    def adopt(self, shape, image, buffer=None):
+        self.images[shape] = image.copy()  # Repainted in place later, so don't share it
+        if buffer is not None:
+            self.buffers[shape] = bytearray(buffer)
+        else:
+            self.buffers.pop(shape, None)
+        self.stale.pop(shape, None)
+        self.dirty[shape] = [(0, 0, self.width, self.height)]
+
+    # Draw a missing frame or repaint its stale cells, and pack it
+    def _bring_up_to_date(self, shape):
+        if shape not in self.images:
+            self.images[shape] = render_frame(self.year, self.width, self.height, self.shaded_days,
+                                              shape, self.selected_day, self.today)
+            self.buffers.pop(shape, None)
+            self.stale.pop(shape, None)
+            self.dirty[shape] = [(0, 0, self.width, self.height)]
+
+        cells = self.stale.pop(shape, None)
+        if cells:
+            layout = get_layout(self.year, self.width, self.height)
+            with metrics.span('repaint'):
+                boxes = repaint_frame(self.images[shape], layout, cells, self.shaded_days, shape,
+                                      self.selected_day, self.today)
+            self.dirty.setdefault(shape, []).extend(boxes)
+            if shape in self.buffers:
+                # Repack only the repainted rows and bytes of the buffer
+                for box in boxes:
+                    framebuffer.update_region(self.buffers[shape], self.images[shape], box, self.width, self.height)
+
+        if shape not in self.buffers:
+            with metrics.span('getbuffer'):
+                self.buffers[shape] = bytearray(self.getbuffer(self.images[shape]))
+
+    # (image, buffer, boxes) of the frame for the shape; the boxes cover everything that
+    # changed since the frame was last handed out (empty if nothing did)
+    def frame(self, shape):
+        self._bring_up_to_date(shape)
+        return self.images[shape], self.buffers[shape], self.dirty.pop(shape, [])
+
+    # Draw the frames of the shapes not shown yet, so switching to them is instant
+    def warm(self):
+        for shape in SHAPES:
+            self._bring_up_to_date(shape)
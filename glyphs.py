@@ -0,0 +1,62 @@
+import calendar
+from functools import lru_cache
+from PIL import Image, ImageChops, ImageDraw
+from layout import get_fonts, WEEKDAYS
+
+# Blank space around whatever is drawn on a scratch canvas, so no stray pixel gets clipped
+MARGIN = 4
+
+
+# Turn something drawn in black on a white 1-bit scratch canvas into a paste mask:
+# returns (mask cropped to the ink, offset of the mask from `origin`), or None if blank
+def ink_mask(canvas, origin):
+    ink = ImageChops.invert(canvas)  # Mask: 1 where the canvas is black
+    bbox = ink.getbbox()
+    if bbox is None:
+        return None
+    return ink.crop(bbox), (bbox[0] - origin[0], bbox[1] - origin[1])
+
+
+# Text rasterized once as a 1-bit mask and pasted wherever it is needed.
+# A mask is what ImageDraw.text would draw at an integer position, cropped to its ink,
+# so pasting it gives the same pixels as drawing the text there.
+class GlyphAtlas:
+    def __init__(self, font, texts=()):
+        self.font = font
+        self.glyphs = {}  # text -> (mask, (dx, dy) from the text origin to the mask) or None if blank
+        for text in texts:
+            self.glyph(text)
+
+    # Mask and offset for the text, rasterized the first time it is asked for
+    def glyph(self, text):
+        if text in self.glyphs:
+            return self.glyphs[text]
+
+        left, top, right, bottom = self.font.getbbox(text, mode='1')
+        origin = (MARGIN - left, MARGIN - top)
+        canvas = Image.new('1', (right - left + 2 * MARGIN, bottom - top + 2 * MARGIN), 255)
+        ImageDraw.Draw(canvas).text(origin, text, font=self.font, fill=0)
+
+        glyph = ink_mask(canvas, origin)
+        self.glyphs[text] = glyph
+        return glyph
+
+    # Paint the text in black with its origin at (x, y), like draw.text((x, y), text, fill=0)
+    def paste(self, image, origin, text):
+        glyph = self.glyph(text)
+        if glyph is None:
+            return
+        mask, (dx, dy) = glyph
+        image.paste(0, (origin[0] + dx, origin[1] + dy), mask)
+
+
+# Atlases for the calendar fonts, built once per process: the large one for the year
+# header (each year's digits are rasterized on first use), the small one prebuilt with
+# every day number, weekday letter and month abbreviation
+@lru_cache(maxsize=None)
+def get_atlases():
+    font_large, font_small = get_fonts()
+    small_texts = [str(day).zfill(2) for day in range(1, 32)]
+    small_texts += sorted(set(WEEKDAYS))
+    small_texts += [calendar.month_name[month][:3] for month in range(1, 13)]
+    return GlyphAtlas(font_large), GlyphAtlas(font_small, small_texts)
@@ -0,0 +1,108 @@
+import calendar
+from collections import namedtuple
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+# Fonts used by the calendar view (adjust paths if needed)
+FONT_LARGE_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+FONT_SMALL_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+FONT_LARGE_SIZE = 24
+FONT_SMALL_SIZE = 14
+
+# Grid geometry (same values render_calendar has always used)
+WEEKDAY_Y = 80  # Move the weekdays lower by increasing this value
+FIRST_MONTH_Y = WEEKDAY_Y + 40  # Spacing between weekdays and month rows
+MONTH_ROW_HEIGHT = 30 + 10 + 5  # Row height plus spacing between month rows
+START_X = 30  # Spacing between month label and day start
+DAY_WIDTH = 25  # Width of each day cell (including spacing)
+DAY_HEIGHT = 30  # Height of each day cell
+SHAPE_DIAMETER = min(20, 30)  # Use the smaller of day_width and day_height
+WEEKDAY_COLUMNS = 40  # Repeat the weekday labels across the screen
+WEEKDAYS = ['M', 'T', 'W', 'T', 'F', 'S', 'S']
+
+# How many year layouts to keep around
+LAYOUT_CACHE_SIZE = 4
+
+# Everything needed to paint one day:
+#   box         - bounding box of everything the day can draw (ring, underline, digits)
+#   text_origin - top left of the zero padded day number
+#   shape_box   - box of the shaded shape (circle, square or triangle)
+#   ring_box    - box of the selection ring around the shape
+#   underline   - line marking the current day
+DayCell = namedtuple('DayCell', ['month', 'day', 'text', 'box', 'text_origin', 'shape_box', 'ring_box', 'underline'])
+
+
+# Load the calendar fonts once per process
+@lru_cache(maxsize=None)
+def get_fonts():
+    font_large = ImageFont.truetype(FONT_LARGE_PATH, FONT_LARGE_SIZE)
+    font_small = ImageFont.truetype(FONT_SMALL_PATH, FONT_SMALL_SIZE)
+    return font_large, font_small
+
+
+# Precomputed positions of every label and day cell for one year on one panel size
+class YearLayout:
+    def __init__(self, year, width, height):
+        self.year = year
+        self.width = width
+        self.height = height
+
+        font_large, font_small = get_fonts()
+
+        # Measure text on a 1-bit scratch image so the boxes match what the paint pass draws
+        draw = ImageDraw.Draw(Image.new('1', (1, 1), 255))
+
+        self.header_origin = (width // 2 - 50, 10)
+        self.header_text = str(year)
+        self.shape_options_origin = (width - 180, 20)  # Shape options in a row at the top right
+        shape_x, shape_y = self.shape_options_origin
+        self.shape_options_box = (shape_x - 1, shape_y - 1, shape_x + 2 * 50 + 20 + 2, shape_y + 20 + 2)
+
+        # Center the weekday labels above the corresponding days
+        january_start_day, _ = calendar.monthrange(year, 1)
+        self.weekday_labels = []
+        for i in range(WEEKDAY_COLUMNS):
+            day_x = START_X + i * DAY_WIDTH
+            label = WEEKDAYS[(january_start_day + i) % 7]
+            bbox = draw.textbbox((0, 0), label, font=font_small)
+            text_width = bbox[2] - bbox[0]
+            self.weekday_labels.append(((day_x + (DAY_WIDTH - text_width) // 2, WEEKDAY_Y), label))
+
+        # Day numbers are the same strings every month, so measure each one once
+        day_sizes = {}
+        for day in range(1, 32):
+            text = str(day).zfill(2)
+            bbox = draw.textbbox((0, 0), text, font=font_small)
+            day_sizes[day] = (text, bbox[2] - bbox[0], bbox[3] - bbox[1])
+
+        self.month_labels = []
+        self.cells = {}
+        for month in range(1, 13):
+            month_y = FIRST_MONTH_Y + (month - 1) * MONTH_ROW_HEIGHT
+            self.month_labels.append(((5, month_y + (DAY_HEIGHT // 2)), calendar.month_name[month][:3]))
+
+            start_day, num_days = calendar.monthrange(year, month)
+            for day in range(1, num_days + 1):
+                day_x = START_X + (start_day + day - 1) * DAY_WIDTH
+                day_y = month_y
+
+                text, text_width, text_height = day_sizes[day]
+                text_origin = (day_x + (DAY_WIDTH - text_width) // 2, day_y + (DAY_HEIGHT - text_height) // 2)
+
+                shape_x = day_x + (DAY_WIDTH - SHAPE_DIAMETER) // 2
+                shape_y = day_y + (DAY_HEIGHT - SHAPE_DIAMETER) // 2
+                shape_box = (shape_x, shape_y, shape_x + SHAPE_DIAMETER, shape_y + SHAPE_DIAMETER)
+                ring_box = (shape_x - 3, shape_y - 3, shape_x + SHAPE_DIAMETER + 3, shape_y + SHAPE_DIAMETER + 3)
+                underline = (day_x, day_y + 35, day_x + DAY_WIDTH, day_y + 35)
+
+                # Exclusive box covering the ring, the 2px underline and the digits
+                box = (min(ring_box[0], day_x) - 1, min(ring_box[1], day_y) - 1,
+                       max(ring_box[2], underline[2]) + 2, max(ring_box[3], underline[3]) + 2)
+
+                self.cells[(month, day)] = DayCell(month, day, text, box, text_origin, shape_box, ring_box, underline)
+
+
+# Get the layout for a year, building it only the first time it is needed
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def get_layout(year, width, height):
+    return YearLayout(year, width, height)
@@ -1,18 +1,75 @@
+import time
+STARTUP_T0 = time.perf_counter()  # Start of the time-to-first-frame measurement
+
+import atexit
 import os
+import resource
+import signal
+import threading
 import tkinter as tk
-from waveshare_epd import epd13in3k
-from PIL import Image, ImageDraw, ImageFont
+from epd_backend import load_epd_module
 import calendar
-from datetime import datetime
-import plots  # Import the plots module
-
-# Directory to store the calendar data
-DATA_DIR = '/home/admin/CalendarDatabase'
+from datetime import datetime, timedelta, time as time_of_day
+from refresh import RefreshEngine
+from scheduler import RefreshScheduler
+from display_worker import DisplayWorker
+from prerender import Prerenderer
+from frames import ShapeFrames
+from session import DisplaySession
+from persistence import PersistenceWorker
+from repository import ShadedDaysRepository
+import metrics  # Per-stage timing spans (CALENDAR_TRACE=1)
+import framebuffer  # Packs frames for the panel without the driver's getbuffer
+
+# The plots module is imported on first use (the 'c' key), optionally warmed up in the
+# background once the first calendar frame is on the panel
+plots = None
+plots_lock = threading.Lock()
+WARM_PLOTS = os.environ.get('CALENDAR_WARM_PLOTS', '1') == '1'
+
+# Startup stages and the time each one took, reported after the first frame
+startup_timings = []
+startup_mark = STARTUP_T0
+
+# Record how long the startup stage that just finished took
+def mark_startup(stage):
+    global startup_mark
+    now = time.perf_counter()
+    startup_timings.append((stage, now - startup_mark))
+    startup_mark = now
+
+# Print the time-to-first-frame report
+def report_startup():
+    stages = ', '.join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in startup_timings)
+    total = (time.perf_counter() - STARTUP_T0) * 1000
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    print(f"Startup: {stages}; time to first frame {total:.0f} ms, peak RSS {peak_rss:.1f} MB")
+
+# Import the plotting backend the first time it is needed
+def get_plots():
+    global plots
+    with plots_lock:
+        if plots is None:
+            start = time.perf_counter()
+            import plots as plots_module
+            plots_module.warm_up()
+            plots = plots_module
+            print(f"Plot backend loaded in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return plots
+
+# Load the plotting backend on a background thread so the first 'c' press is quick
+def warm_plots_in_background():
+    threading.Thread(target=get_plots, name='plots-warmup', daemon=True).start()
+
+mark_startup("imports")
+
+# Panel driver: the Waveshare 13.3" driver, or the simulated panel with CALENDAR_EPD=sim
+epd13in3k = load_epd_module()
 
 # Initialize the e-paper display
 def initialize_epaper():
     try:
-        epd = epd13in3k.EPD()
+        epd = metrics.instrument_epd(epd13in3k.EPD())  # Time SPI transfer and busy-wait separately
         epd.init()  # Full initialization for the first display
         print("E-paper display initialized.")
         return epd
@@ -20,14 +77,27 @@ def initialize_epaper():
         print(f"Error initializing e-paper display: {e}")
         return None
 
-# Global variables to store the shaded days, selection ring, sleep timer, and sleep state
-shaded_days = {}  # Store shaded days with their shape type
+# Global variables to store the selection ring and sleep timer
 selection_ring_visible = False  # Start with the selection ring hidden
 selection_ring_timer_id = None
-refresh_timer_id = None
 sleep_timer_id = None
-display_asleep = False  # Track if the display is asleep
+sleep_pending = False  # The sleep timer fired; waiting for the pending refreshes
+midnight_timer_id = None
 epd = initialize_epaper()  # Initialize the e-paper display
+refresh_engine = RefreshEngine(epd)  # Tracks the last frame so only changed regions are refreshed
+display_session = DisplaySession(epd, refresh_engine)  # Panel power state, cheap wake-up
+persistence_worker = PersistenceWorker()  # All file writes happen on this thread
+persistence_worker.start()
+repository = ShadedDaysRepository(persistence_worker)  # Shared by the calendar and plot views
+display_worker = DisplayWorker()  # Rendering and all panel I/O happen on this thread
+display_worker.start()
+# Renders the years either side of the current one in the background for instant 'a' / 'd'
+prerenderer = Prerenderer(repository, epd13in3k.EPD_WIDTH, epd13in3k.EPD_HEIGHT,
+                          lambda image: framebuffer.get_buffer(epd, image))
+prerenderer.start()
+# The current year's frame for each shape (used by the display worker only)
+shape_frames = ShapeFrames(epd13in3k.EPD_WIDTH, epd13in3k.EPD_HEIGHT, lambda image: framebuffer.get_buffer(epd, image))
+mark_startup("display init")
 
 # Shape types: 1 = circle, 2 = square, 3 = triangle
 current_shape = 1  # Default to circle
@@ -36,52 +106,18 @@ shapes = {1: "Circle", 2: "Square", 3: "Triangle"}
 # View mode: 'calendar' or 'plot'
 view_mode = 'calendar'
 
-# Save shaded days with shape type to a file
-def save_shaded_days(year):
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-
-    file_path = os.path.join(DATA_DIR, f'{year}.txt')
-
-    with open(file_path, 'w') as file:
-        for (month, day), shape in sorted(shaded_days.items()):
-            file.write(f'{month},{day},{shape}\n')
-    print(f"Shaded days saved to {file_path}")
-
-# Updated function to load shaded days with shape type from a file
+# Load the shaded days for the year into the repository
 def load_shaded_days(year):
-    global shaded_days  # Add this line to modify the global shaded_days
-    file_path = os.path.join(DATA_DIR, f'{year}.txt')
-
-    shaded_days.clear()  # Clear previous year's data
-
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            for line in file:
-                values = line.strip().split(',')
-                if len(values) == 3:  # New format with month, day, and shape
-                    month, day, shape = map(int, values)
-                elif len(values) == 2:  # Old format with just month and day, default to circle (1)
-                    month, day = map(int, values)
-                    shape = 1  # Default to circle
-                else:
-                    continue  # Skip lines that don't match the expected format
-                shaded_days[(month, day)] = shape
-        print(f"Shaded days loaded from {file_path}")
-    else:
-        print(f"No file found for {year}. Creating new file...")
-        save_shaded_days(year)
+    repository.load(year)
 
-# Check if the e-paper display is asleep and wake it up
+# Check if the e-paper display is asleep and wake it up (runs on the display worker)
 def check_and_wake_display():
-    global display_asleep, epd
-    if display_asleep:
-        print("Waking up e-paper display...")
-        try:
-            epd = initialize_epaper()  # Reinitialize the display
-            display_asleep = False
-        except Exception as e:
-            print(f"Error waking up e-paper display: {e}")
+    try:
+        # Same driver object and the last frame kept in RAM: the next push re-arms the
+        # controller and refreshes only what changed while it slept
+        display_session.wake()
+    except Exception as e:
+        print(f"Error waking up e-paper display: {e}")
 
 # Revert the selection ring to the current day after 30 seconds of inactivity
 def revert_selection_to_current_day():
@@ -93,14 +129,25 @@ def revert_selection_to_current_day():
     current_day_index = current_date.day - 1
 
     selection_ring_visible = True
-    render_calendar(current_year)  # Redraw the calendar with the ring on the current day
+    request_refresh()  # Redraw the calendar with the ring on the current day
 
-# Put the e-paper display to sleep after 30 seconds of inactivity
+# Put the e-paper display to sleep after 30 seconds of inactivity, once the refreshes
+# still pending (the selection ring reverting on the same timeout) have been pushed
 def sleep_epaper():
-    global display_asleep
+    global sleep_timer_id, sleep_pending
+    sleep_timer_id = None
+    if not sleep_pending:
+        sleep_pending = True
+        refresh_scheduler.when_idle(put_display_to_sleep)
+
+def put_display_to_sleep():
+    global sleep_pending
+    sleep_pending = False
+    if sleep_timer_id is not None:
+        return  # A key press since the timeout re-armed the sleep timer
     print("E-paper display going to sleep due to inactivity.")
-    epd.sleep()
-    display_asleep = True  # Mark the display as asleep
+    refresh_scheduler.cancel_ghost_clear()  # Don't wake the panel just to clear ghosting
+    display_worker.submit_command(display_session.sleep)  # Not replaced by a later frame
 
 # Reset the timer to revert the selection ring and sleep the display
 def reset_timers():
@@ -124,30 +171,45 @@ def quick_refresh():
     except Exception as e:
         print(f"Error during quick refresh: {e}")
 
-# Debounce refresh logic
-def debounce_refresh():
-    global refresh_timer_id
-
-    # If there's an existing timer, cancel it
-    if refresh_timer_id:
-        root.after_cancel(refresh_timer_id)
+# Ask the scheduler for a refresh: immediate on an idle panel, coalesced while one is in progress
+def request_refresh():
+    refresh_scheduler.request()
 
-    # Set a new timer to refresh after 1 second
-    refresh_timer_id = root.after(1000, lambda: render_calendar(current_year))
-
-# Function to render the shapes in a row in the top right corner
-def draw_shape_options(draw, shape_x, shape_y, font_small):
-    # Adjusted for more spacing between the shapes and moved further to the right
-    shape_spacing = 50  # Spacing between shapes
-
-    # Display shapes in a single row with even spacing
-    draw.ellipse([shape_x, shape_y, shape_x + 20, shape_y + 20], fill=0 if current_shape == 1 else None, outline=0)
-    draw.rectangle([shape_x + shape_spacing, shape_y, shape_x + shape_spacing + 20, shape_y + 20], fill=0 if current_shape == 2 else None, outline=0)
-    draw.polygon([shape_x + 2 * shape_spacing, shape_y + 20, shape_x + 2 * shape_spacing + 10, shape_y, shape_x + 2 * shape_spacing + 20, shape_y + 20], fill=0 if current_shape == 3 else None, outline=0)
-
-# Main function to render the calendar
-def render_calendar(year):
-    global current_month_index, current_day_index, global_image, current_date
+# Snapshot whatever view is showing and return the job that draws it (called by the
+# refresh scheduler on the Tk thread; the job runs on the display worker)
+def refresh_view():
+    if view_mode == 'calendar':
+        return calendar_job()
+    return plot_job()
+
+# Copy the state the calendar frame depends on, so the Tk thread can keep changing it
+def calendar_job():
+    year = current_year
+    version, days = repository.snapshot(year)
+    shape = current_shape
+    selected_day = (current_month_index + 1, current_day_index + 1) if selection_ring_visible else None
+    today = (current_date.month, current_date.day)
+    neighbours = neighbour_frames(year, shape, selected_day, today)
+    return lambda: render_calendar(year, version, days, shape, selected_day, today, neighbours)
+
+# The frames to prerender for the next 'a' / 'd': the neighbouring years in the same view
+# state. On December 31st of the real year the next year is prerendered the way the
+# midnight tick will show it instead, with the underline (and a ring that is on today)
+# moved to January 1st, so the rollover only has to push it.
+def neighbour_frames(year, shape, selected_day, today):
+    next_year = (year + 1, shape, selected_day, today)
+    if year == today_date.year and (today_date.month, today_date.day) == (12, 31):
+        next_year = (year + 1, shape, (1, 1) if selected_day == today else selected_day, (1, 1))
+    return [(year - 1, shape, selected_day, today), next_year]
+
+def plot_job():
+    year = current_year
+    shape = current_shape
+    return lambda: render_plot(year, shape)
+
+# Main function to render the calendar (runs on the display worker)
+def render_calendar(year, version, days, shape, selected_day, today, neighbours=()):
+    global global_image
 
     if epd is None:
         print("E-paper display not initialized properly.")
@@ -156,132 +218,59 @@ def render_calendar(year):
     try:
         check_and_wake_display()  # Ensure the display is awake before drawing
 
-        # Create a blank image (1-bit, black-and-white)
-        epd_width = epd.width
-        epd_height = epd.height
-        global_image = Image.new('1', (epd_width, epd_height), 255)  # 255 means white background
-
-        # Create a drawing object to draw on the image
-        draw = ImageDraw.Draw(global_image)
-
-        # Define fonts (adjust paths if needed)
-        font_large = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 24)
-        font_small = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 14)
-
-        # Draw the year header at the top
-        draw.text((epd_width // 2 - 50, 10), str(year), font=font_large, fill=0)
-
-        # Draw shape options in a row at the top right
-        shape_x = epd_width - 180  # Moved further right
-        shape_y = 20
-        draw_shape_options(draw, shape_x, shape_y, font_small)
-
-        # Adjust these parameters to control spacing
-        weekday_y = 80  # Move the weekdays lower by increasing this value
-        first_month_y = weekday_y + 40  # Adjust this to maintain the spacing between weekdays and month rows
-
-        # Get the starting weekday of January 1st (0 = Monday, 6 = Sunday)
-        january_start_day, _ = calendar.monthrange(year, 1)
-
-        # Define the starting X position for the weekday row and days
-        start_x = 30  # Spacing between month label and day start
-        day_width = 25  # Width of each day cell (including spacing)
-
-        # Center the weekday labels above the corresponding days
-        weekdays = ['M', 'T', 'W', 'T', 'F', 'S', 'S']
-        for i in range(40):  # Loop to fill the width of the screen with repeating weekdays
-            day_x = start_x + i * day_width
-            weekday_index = (january_start_day + i) % 7
-
-            # Calculate the center position of the weekday label
-            bbox = draw.textbbox((0, 0), weekdays[weekday_index], font=font_small)
-            text_width = bbox[2] - bbox[0]
-            text_x = day_x + (day_width - text_width) // 2
-
-            draw.text((text_x, weekday_y), weekdays[weekday_index], font=font_small, fill=0)
-
-        # Start drawing months and days staggered according to the start day of the month
-        for month in range(1, 13):
-            month_name = calendar.month_name[month][:3]
-
-            # Adjust spacing between month rows
-            month_y = first_month_y + (month - 1) * (30 + 10 + 5)  # Adjust '10' to control spacing between month rows
-
-            # Adjust the position of the month label to align with day numbers
-            draw.text((5, month_y + (30 // 2)), month_name, font=font_small, fill=0)  # Adjust this value to align the month name with the days
-
-            start_day, num_days = calendar.monthrange(year, month)
-
-            # Draw days of the month in a single row
-            for day in range(1, num_days + 1):
-                day_x = start_x + (start_day + day - 1) * day_width
-                day_y = month_y
-
-                # Get the bounding box of the day number to center it
-                bbox = draw.textbbox((0, 0), str(day).zfill(2), font=font_small)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-
-                text_x = day_x + (day_width - text_width) // 2  # Center horizontally
-                text_y = day_y + (30 - text_height) // 2  # Center vertically
-
-                # Center the shape (circle, square, triangle) around the day number
-                shape_diameter = min(20, 30)  # Use the smaller of day_width and day_height
-                shape_x = day_x + (day_width - shape_diameter) // 2  # Center the shape horizontally
-                shape_y = day_y + (30 - shape_diameter) // 2  # Center the shape vertically
-
-                # Underline the current day (fixed underline)
-                if month == current_date.month and day == current_date.day:
-                    draw.line([day_x, day_y + 35, day_x + day_width, day_y + 35], fill=0, width=2)
-
-                # Draw the selection shape if the ring is visible and the day is selected
-                if selection_ring_visible and month - 1 == current_month_index and day - 1 == current_day_index:
-                    if current_shape == 1:  # Circle
-                        draw.ellipse([shape_x - 3, shape_y - 3, shape_x + shape_diameter + 3, shape_y + shape_diameter + 3], outline=0, width=2)
-                    elif current_shape == 2:  # Square
-                        draw.rectangle([shape_x - 3, shape_y - 3, shape_x + shape_diameter + 3, shape_y + shape_diameter + 3], outline=0, width=2)
-                    elif current_shape == 3:  # Triangle
-                        draw.polygon([shape_x, shape_y + shape_diameter, shape_x + shape_diameter / 2, shape_y,
-                                      shape_x + shape_diameter, shape_y + shape_diameter], outline=0, width=2)
-
-                # Draw a shaded shape if the day is shaded and the current shape matches
-                if (month, day) in shaded_days and shaded_days[(month, day)] == current_shape:
-                    if current_shape == 1:  # Circle
-                        draw.ellipse([shape_x, shape_y, shape_x + shape_diameter, shape_y + shape_diameter], fill=0)
-                    elif current_shape == 2:  # Square
-                        draw.rectangle([shape_x, shape_y, shape_x + shape_diameter, shape_y + shape_diameter], fill=0)
-                    elif current_shape == 3:  # Triangle
-                        draw.polygon([shape_x, shape_y + shape_diameter, shape_x + shape_diameter / 2, shape_y,
-                                      shape_x + shape_diameter, shape_y + shape_diameter], fill=0)
-
-                # Draw the day number
-                draw.text((text_x, text_y), str(day).zfill(2), font=font_small, fill=0)
-
-        # Perform the quick refresh for the calendar display
-        epd.display(epd.getbuffer(global_image))  # Quick refresh
-        print("Quick refresh performed with updated calendar.")
+        # Repaint the cells that changed in the year's per-shape frames (all of them on a new year)
+        shape_frames.update(year, days, selected_day, today)
+        if not shape_frames.has(shape):
+            frame = prerenderer.lookup(year, version, shape, selected_day, today)
+            if frame is not None:
+                shape_frames.adopt(shape, *frame)  # Prerendered while the user was on a neighbouring year
+                print(f"Using the prerendered frame for {year}.")
+        global_image, buffer, boxes = shape_frames.frame(shape)
+
+        # When only some cells were repainted (the ring moved, a day was toggled) push just
+        # their boxes; otherwise push the regions that changed (full refresh if most of it did)
+        refresh_engine.push_region(buffer, boxes, shape_frames.source(shape))
+        display_session.updated()
+        print("Refresh performed with updated calendar.")
+
+        # Have the other shapes' frames ready for the next 1 / 2 / 3
+        shape_frames.warm()
+
+        # Get the neighbouring years ready for the next 'a' / 'd' (or the new year at midnight)
+        prerenderer.prefetch(neighbours)
     except Exception as e:
         print(f"Error displaying on e-paper: {e}")
 
+# Show the monthly plot (runs on the display worker)
+def render_plot(year, shape):
+    if epd is None:
+        print("E-paper display not initialized properly.")
+        return
+
+    check_and_wake_display()
+    # Through the refresh engine as well, so a shape or year change only refreshes what changed
+    get_plots().plot_year_data(epd, repository, year, shape, refresh_engine)
+    display_session.updated()
+
 # Initialize current selected day (for arrow key navigation)
 current_date = datetime.now()
+today_date = current_date.date()  # The real date (current_date follows the year being viewed)
 current_year = current_date.year
 current_month_index = current_date.month - 1
 current_day_index = current_date.day - 1  # Zero-based index for days
 
 # Load the shaded days for the current year
 load_shaded_days(current_year)
+mark_startup("data load")
 
-# Example function to update calendar on arrow key presses with debounce
+# Example function to move the selection ring on arrow key presses
 def move_selection(direction):
     global current_day_index, current_month_index, selection_ring_visible
 
-    check_and_wake_display()  # Ensure display is awake before movement
-
     if not selection_ring_visible:
         # Show the ring on the current day for the first key press
         selection_ring_visible = True
-        debounce_refresh()
+        request_refresh()
         return
 
     if direction == "right":
@@ -298,8 +287,44 @@ def move_selection(direction):
     # Reset the timer to hide the selection ring and sleep the display
     reset_timers()
 
-    # Debounce the refresh (wait 1 second before refreshing)
-    debounce_refresh()
+    # Refresh now, or right after the refresh already in progress
+    request_refresh()
+
+# Fire the date-change tick just after the next local midnight. The delay is measured to
+# midnight as local wall-clock time, so days of 23 or 25 hours around DST changes are handled.
+def schedule_midnight_tick():
+    global midnight_timer_id
+    midnight = datetime.combine(datetime.now().date() + timedelta(days=1), time_of_day())
+    delay_ms = int((midnight.timestamp() - time.time()) * 1000) + 1000  # A second late rather than early
+    midnight_timer_id = root.after(max(delay_ms, 1000), midnight_tick)
+
+# Move the "today" underline to the new date (a partial refresh of the two cells). On
+# January 1st the view rolls into the new year if it was showing the old one.
+def midnight_tick():
+    global current_date, today_date, current_year, current_month_index, current_day_index
+    now = datetime.now()
+    if now.date() == today_date:
+        schedule_midnight_tick()  # Woke up early (clock adjusted), try again
+        return
+
+    metrics.mark("midnight tick")
+    old_today = today_date
+    today_date = now.date()
+    print(f"Date changed to {today_date}.")
+
+    # Keep the selection ring on today if that's where it was
+    if (current_month_index + 1, current_day_index + 1) == (old_today.month, old_today.day):
+        current_month_index = now.month - 1
+        current_day_index = now.day - 1
+
+    current_date = now
+    if now.year != old_today.year and current_year == old_today.year:
+        current_year = now.year  # Prerendered on December 31st (see neighbour_frames)
+        load_shaded_days(current_year)
+
+    request_refresh()
+    reset_timers()  # Let the panel go back to sleep afterwards
+    schedule_midnight_tick()
 
 # Function to change the calendar year
 def change_year(delta):
@@ -307,55 +332,39 @@ def change_year(delta):
     current_year += delta
     current_date = current_date.replace(year=current_year)
     load_shaded_days(current_year)
-    if view_mode == 'calendar':
-        render_calendar(current_year)
-    else:
-        plots.plot_year_data(epd,current_year, current_shape)  # Update the plot with the new year
+    request_refresh()  # Redraws the calendar or the plot for the new year
 
 # Example function to shade/unshade a day with the current shape and refresh the display
 def shade_day():
-    global shaded_days
-
-    check_and_wake_display()  # Ensure display is awake before shading
-
     current_day = (current_month_index + 1, current_day_index + 1)
 
-    # Toggle shading on the current day with the current shape
-    if current_day in shaded_days and shaded_days[current_day] == current_shape:
-        del shaded_days[current_day]
-    else:
-        shaded_days[current_day] = current_shape
-
-    # Save the shaded days after any change
-    save_shaded_days(current_year)
+    # Toggle shading on the current day with the current shape; the repository
+    # updates its counters and hands the change to the persistence worker
+    repository.toggle(current_year, *current_day, current_shape)
+    prerenderer.discard(current_year)  # Its prerendered frame (if any) is out of date
 
     # Reset the timer to hide the selection ring and sleep the display
     reset_timers()
 
-    # Debounce the refresh (wait 1 second before refreshing)
-    debounce_refresh()
+    # Refresh now, or right after the refresh already in progress
+    request_refresh()
 
 # Function to change the current shape
 def change_shape(shape):
     global current_shape
     current_shape = shape
     print(f"Shape changed to {shapes[shape]}")
-    if view_mode == 'calendar':
-        debounce_refresh()  # Refresh the display when the shape is changed
-    else:
-        # Update the plot with the new shape
-        plots.plot_year_data(epd, current_year, current_shape)
+    request_refresh()  # Redraws the calendar or the plot with the new shape
 
 # Function to handle the 'C' key press to toggle between calendar and plot
 def toggle_plot():
     global view_mode
     if view_mode == 'calendar':
-        plots.plot_year_data(epd, current_year, current_shape)  # Pass epd as an argument
         view_mode = 'plot'
     else:
-        plots.close_plot(epd)  # Pass epd as an argument
-        render_calendar(current_year)  # Return to calendar view
+        get_plots().close_plot(epd)  # Pass epd as an argument
         view_mode = 'calendar'
+    request_refresh()  # The display worker draws the new view
 
 
 # Tkinter Setup for Key Bindings
@@ -366,24 +375,54 @@ root.geometry("400x200")  # Increase the window size for visibility
 root.title("Calendar Controller")  # Set a title for the window
 root.resizable(False, False)  # Disable resizing
 
+# Decides when the panel is redrawn (see scheduler.py)
+refresh_scheduler = RefreshScheduler(root, refresh_view, refresh_engine, display_worker)
+
 # Render the calendar on start
-render_calendar(current_year)
+display_worker.submit(calendar_job())
+display_worker.wait_idle()
+mark_startup("first frame")
+report_startup()
+
+if WARM_PLOTS:
+    warm_plots_in_background()
+
+# Record when a key event arrives, then handle it
+def on_key(action):
+    def handler(event):
+        metrics.mark(f"event {event.keysym}")
+        action()
+    return handler
 
 # Bind keys to the movement and shading functions
-root.bind('<Right>', lambda event: move_selection("right"))
-root.bind('<Left>', lambda event: move_selection("left"))
-root.bind('<space>', lambda event: shade_day())  # Spacebar to shade/unshade
-root.bind('c', lambda event: toggle_plot())  # Toggle between calendar and plot
+root.bind('<Right>', on_key(lambda: move_selection("right")))
+root.bind('<Left>', on_key(lambda: move_selection("left")))
+root.bind('<space>', on_key(shade_day))  # Spacebar to shade/unshade
+root.bind('c', on_key(toggle_plot))  # Toggle between calendar and plot
 
 # Bind keys to shape selection (1 for Circle, 2 for Square, 3 for Triangle)
-root.bind('1', lambda event: change_shape(1))
-root.bind('2', lambda event: change_shape(2))
-root.bind('3', lambda event: change_shape(3))
+root.bind('1', on_key(lambda: change_shape(1)))
+root.bind('2', on_key(lambda: change_shape(2)))
+root.bind('3', on_key(lambda: change_shape(3)))
 
 # Bind keys to change the year using 'a' and 'd'
-root.bind('a', lambda event: change_year(-1))  # Press 'a' to go to the previous year
-root.bind('d', lambda event: change_year(1))   # Press 'd' to go to the next year
+root.bind('a', on_key(lambda: change_year(-1)))  # Press 'a' to go to the previous year
+root.bind('d', on_key(lambda: change_year(1)))   # Press 'd' to go to the next year
+
+# Write any pending changes to disk before exiting
+def shutdown():
+    print("Shutting down, flushing pending changes...")
+    prerenderer.stop()
+    display_worker.stop()  # Let the refresh in progress finish
+    persistence_worker.stop()
+    root.destroy()
+
+root.protocol("WM_DELETE_WINDOW", shutdown)
+signal.signal(signal.SIGTERM, lambda signum, frame: shutdown())
+atexit.register(persistence_worker.stop)  # Backstop for any other way out of the mainloop
+metrics.install_export_signal()  # kill -USR1 <pid> writes the timing trace as CSV and Chrome trace JSON
 
 # Start the Tkinter event loop
 reset_timers()  # Start the selection ring and sleep timers
+schedule_midnight_tick()  # Keep "today" right on a device left running
 root.mainloop()
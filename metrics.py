@@ -0,0 +1,144 @@
+import csv
+import json
+import os
+import signal
+import threading
+import time
+from collections import deque
+
+# Timing spans for the display pipeline, kept in a ring buffer and exported on demand.
+# Turned on with CALENDAR_TRACE=1; when off, span() hands back a shared no-op object.
+ENABLED = os.environ.get('CALENDAR_TRACE', '0') == '1'
+RING_SIZE = 4096
+TRACE_DIR = os.environ.get('CALENDAR_TRACE_DIR', '/tmp')
+
+# (name, start seconds, duration seconds, thread name); duration None marks an instant event
+records = deque(maxlen=RING_SIZE)
+busy_time = threading.local()  # Busy-wait seconds accumulated during the current panel call
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        records.append((self.name, self.start, time.perf_counter() - self.start, threading.current_thread().name))
+        return False
+
+
+# Time a block: `with metrics.span('paint'): ...`
+def span(name):
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(name)
+
+
+# Record a span measured elsewhere
+def record(name, start, duration):
+    if ENABLED:
+        records.append((name, start, duration, threading.current_thread().name))
+
+
+# Record an instant event (a key press arriving, a timer firing)
+def mark(name):
+    if ENABLED:
+        records.append((name, time.perf_counter(), None, threading.current_thread().name))
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+# Wrap the panel driver so each push is split into SPI transfer and busy-wait time
+def instrument_epd(epd):
+    if epd is None or getattr(epd, 'instrumented', False):
+        return epd
+
+    read_busy = epd.ReadBusy
+
+    def timed_read_busy(*args, **kwargs):
+        if not ENABLED:
+            return read_busy(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return read_busy(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            busy_time.seconds = getattr(busy_time, 'seconds', 0.0) + duration
+            record('busy_wait', start, duration)
+
+    def timed(method):
+        def call(*args, **kwargs):
+            if not ENABLED:
+                return method(*args, **kwargs)
+            busy_time.seconds = 0.0
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                # Whatever wasn't spent waiting on the busy line went into sending data
+                record('spi_transfer', start, time.perf_counter() - start - busy_time.seconds)
+        return call
+
+    epd.ReadBusy = timed_read_busy
+    epd.display = timed(epd.display)
+    epd.display_Partial = timed(epd.display_Partial)
+    epd.instrumented = True
+    return epd
+
+
+# Write the recorded spans as CSV: name, start_ms, duration_ms, thread
+def export_csv(path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['name', 'start_ms', 'duration_ms', 'thread'])
+        for name, start, duration, thread in list(records):
+            writer.writerow([name, f'{start * 1000:.3f}', '' if duration is None else f'{duration * 1000:.3f}', thread])
+    return path
+
+
+# Write the recorded spans in Chrome trace format (open in chrome://tracing or Perfetto)
+def export_chrome_trace(path):
+    events = []
+    for name, start, duration, thread in list(records):
+        event = {'name': name, 'pid': os.getpid(), 'tid': thread, 'ts': start * 1e6}
+        if duration is None:
+            event.update(ph='i', s='t')
+        else:
+            event.update(ph='X', dur=duration * 1e6)
+        events.append(event)
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+    return path
+
+
+# Export both formats into TRACE_DIR
+def export(directory=None):
+    directory = directory or TRACE_DIR
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    csv_path = export_csv(os.path.join(directory, f'calendar-trace-{stamp}.csv'))
+    trace_path = export_chrome_trace(os.path.join(directory, f'calendar-trace-{stamp}.json'))
+    print(f"Trace exported to {csv_path} and {trace_path}")
+
+
+# Export the trace whenever the process receives SIGUSR1 (kill -USR1 <pid>)
+def install_export_signal():
+    signal.signal(signal.SIGUSR1, lambda signum, frame: export())
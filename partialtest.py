@@ -1,8 +1,11 @@
 import tkinter as tk
-from waveshare_epd import epd13in3k
+from epd_backend import load_epd_module
 from PIL import Image, ImageDraw
 import time
 
+# Panel driver: the Waveshare 13.3" driver, or the simulated panel with CALENDAR_EPD=sim
+epd13in3k = load_epd_module()
+
 # Initialize the e-paper display
 def initialize_epaper():
     try:
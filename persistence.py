@@ -0,0 +1,125 @@
+import threading
+import storage
+import metrics
+
+# Wait this long after a change for more toggles before writing the batch
+COALESCE_DELAY = 0.5  # seconds
+# Wait this long before retrying a batch that failed to write (full or read-only disk)
+RETRY_DELAY = 5.0  # seconds
+
+
+# Background thread that owns all writes to the data directory.
+# The UI thread only records what changed; the worker coalesces bursts of
+# changes per day and writes them as one fsync'd journal append per year.
+class PersistenceWorker(threading.Thread):
+    def __init__(self, coalesce_delay=COALESCE_DELAY):
+        super().__init__(name='persistence', daemon=True)
+        self.coalesce_delay = coalesce_delay
+        self.condition = threading.Condition()
+        self.pending = {}  # year -> {'snapshot': dict or None, 'changes': {(month, day): shape or None}}
+        self.in_flight = {}  # Batch currently being written
+        self.flushing = False
+        self.stopping = False
+
+    def _entry(self, year):
+        return self.pending.setdefault(year, {'snapshot': None, 'changes': {}})
+
+    # Record the new state of one day (shape None means cleared)
+    def notify(self, year, month, day, shape):
+        with self.condition:
+            self._entry(year)['changes'][(month, day)] = shape
+            self.condition.notify_all()
+
+    # Replace a whole year's file with the given data
+    def save_snapshot(self, year, shaded_days):
+        with self.condition:
+            entry = self._entry(year)
+            entry['snapshot'] = dict(shaded_days)
+            entry['changes'] = {}
+            self.condition.notify_all()
+
+    # Apply changes that have not reached the disk yet to data loaded from it
+    def overlay(self, year, shaded_days):
+        with self.condition:
+            for batch in (self.in_flight, self.pending):
+                entry = batch.get(year)
+                if entry is None:
+                    continue
+                if entry['snapshot'] is not None:
+                    shaded_days.clear()
+                    shaded_days.update(entry['snapshot'])
+                for key, shape in entry['changes'].items():
+                    if shape is None:
+                        shaded_days.pop(key, None)
+                    else:
+                        shaded_days[key] = shape
+        return shaded_days
+
+    # Put a batch that failed to write back in front of the changes recorded since
+    def _requeue(self, failed):
+        for year, entry in failed.items():
+            newer = self.pending.get(year)
+            if newer is not None and newer['snapshot'] is not None:
+                continue  # A newer full rewrite replaces the failed batch anyway
+            if newer is not None:
+                entry['changes'].update(newer['changes'])
+            self.pending[year] = entry
+
+    # Write a batch; returns the entries of the years that failed
+    def _write(self, batch):
+        failed = {}
+        for year, entry in batch.items():
+            try:
+                if entry['snapshot'] is not None:
+                    storage.compact(year, entry['snapshot'])
+                    print(f"Shaded days saved to {storage.snapshot_path(year)}")
+                if entry['changes']:
+                    storage.append_changes(year, entry['changes'])
+                    print(f"Saved {len(entry['changes'])} change(s) for {year}")
+            except Exception as e:
+                print(f"Error saving shaded days for {year}: {e}")
+                failed[year] = entry
+        return failed
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if not self.pending:
+                    break
+
+                # Give a burst of key presses time to settle into one write
+                self.condition.wait_for(lambda: self.flushing or self.stopping, self.coalesce_delay)
+
+                self.in_flight, self.pending = self.pending, {}
+
+            with metrics.span('persistence'):
+                failed = self._write(self.in_flight)
+
+            with self.condition:
+                self.in_flight = {}
+                if failed and self.stopping:
+                    print(f"Giving up on unsaved changes for {sorted(failed)}")
+                elif failed:
+                    # Keep the batch and retry it with whatever has been recorded by then
+                    self._requeue(failed)
+                    self.condition.wait_for(lambda: self.stopping, RETRY_DELAY)
+                self.condition.notify_all()
+
+    # Block until everything recorded so far is on disk
+    def flush(self, timeout=None):
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: not self.pending and not self.in_flight, timeout)
+            self.flushing = False
+
+    # Flush and stop the worker (called on shutdown)
+    def stop(self, timeout=10):
+        if not self.is_alive():
+            return
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.join(timeout)
@@ -1,10 +1,17 @@
-import matplotlib.pyplot as plt
 import os
 import calendar
-from PIL import Image
-from waveshare_epd import epd13in3k  # Import Waveshare e-paper library
-from matplotlib.patches import Ellipse, Rectangle, Polygon
-from matplotlib.ticker import MaxNLocator  # Import MaxNLocator if needed
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+import render  # Shape legend shared with the calendar view
+import framebuffer
+from layout import FONT_LARGE_PATH, FONT_SMALL_PATH
+
+# Plot backend: 'pil' draws the chart straight onto a 1-bit image at panel resolution,
+# 'matplotlib' is the old (slow) renderer, imported only when it is selected
+PLOT_BACKEND = os.environ.get('CALENDAR_PLOT_BACKEND', 'pil')
+
+# Space around the chart area: left, top, right, bottom
+CHART_MARGINS = (60, 90, 30, 50)
 
 # We'll pass the epd object from main.py
 plot_active = False  # Track whether the plot is active
@@ -13,53 +20,128 @@ first_plot = True    # Track whether it's the first time displaying the plot
 # Shapes dictionary (must be consistent with main.py)
 shapes = {1: "Circle", 2: "Square", 3: "Triangle"}
 
-# Function to read the shaded days from the txt file for the selected year and shape
-def read_shaded_days(year, shape):
-    data_dir = '/home/admin/CalendarDatabase'
-    file_path = os.path.join(data_dir, f'{year}.txt')
-    if not os.path.exists(file_path):
-        print(f"No data for {year}.")
-        return {}
-    
-    shaded_days = {}
-    with open(file_path, 'r') as file:
-        for line in file:
-            values = line.strip().split(',')
-            if len(values) >= 3:
-                month, day, shape_type = map(int, values[:3])
-                if shape_type == shape:
-                    if month not in shaded_days:
-                        shaded_days[month] = []
-                    shaded_days[month].append(day)
-            else:
-                continue  # Skip lines that don't have enough data
-    return shaded_days
-
-# Function to generate the plot as a PNG image and display it on the e-paper
-def plot_year_data(epd, year, shape):
+# Function to render the monthly plot in memory and display it on the e-paper.
+# With a RefreshEngine the frame goes through it, so only what changed is refreshed.
+def plot_year_data(epd, repository, year, shape, engine=None):
     global plot_active, shapes, first_plot  # Ensure variables are in scope
 
-    shaded_days = read_shaded_days(year, shape)
-    if not shaded_days:
+    # Monthly counts are kept up to date by the shared repository, no disk reads
+    months = list(range(1, 13))
+    days_count = repository.monthly_counts(year, shape)
+    if not any(days_count):
         print("No shaded days found for the selected shape.")
         # Skip clearing the e-paper display
         return
 
-    # Prepare data for plotting
-    months = list(range(1, 13))
-    days_count = [len(shaded_days.get(month, [])) for month in months]
+    plot = None
+    if PLOT_BACKEND == 'matplotlib':
+        try:
+            plot = render_plot_matplotlib(year, shape, months, days_count, epd.width, epd.height)
+        except ImportError as e:
+            print(f"Matplotlib backend unavailable ({e}), using the PIL renderer.")
+    if plot is None:
+        plot = render_plot_image(year, shape, days_count, epd.width, epd.height)
+
+    # Hand the frame straight to the display, no file round trip
+    if engine is not None:
+        engine.push(to_1bit(plot))
+    else:
+        display_plot_on_epaper(epd, plot)
+    plot_active = True    # Mark plot as active
+    first_plot = False    # Subsequent calls are not the first plot
+
+# Load what the configured backend needs ahead of the first plot
+def warm_up():
+    get_chart_fonts()
+    if PLOT_BACKEND == 'matplotlib':
+        try:
+            from matplotlib.figure import Figure  # noqa: F401
+            from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: F401
+        except ImportError as e:
+            print(f"Matplotlib backend unavailable ({e}), using the PIL renderer.")
+
+# Load the chart fonts once: title, tick labels and month names
+@lru_cache(maxsize=None)
+def get_chart_fonts():
+    title_font = ImageFont.truetype(FONT_LARGE_PATH, 24)
+    tick_font = ImageFont.truetype(FONT_SMALL_PATH, 12)
+    month_font = ImageFont.truetype(FONT_SMALL_PATH, 16)
+    return title_font, tick_font, month_font
+
+# Function to draw the monthly line chart straight onto a 1-bit image
+def render_plot_image(year, shape, days_count, width, height):
+    title_font, tick_font, month_font = get_chart_fonts()
+
+    image = Image.new('1', (width, height), 255)  # 255 means white background
+    draw = ImageDraw.Draw(image)
+
+    # Title centered at the top, with the shape legend inline on the right
+    draw.text((width // 2, 30), f'{shapes[shape]} Shaded Days in {year}', font=title_font, fill=0, anchor='mm')
+    render.draw_shape_options(draw, width - 180, 20, shape)
+
+    left, top, right, bottom = CHART_MARGINS
+    x0, y0, x1, y1 = left, top, width - right, height - bottom
 
-    # Adjust the figure size and DPI to match e-paper resolution (960x680)
+    # Months sit half a step in from the edges, the y-axis runs from 1 to 31
+    def to_x(month):
+        return x0 + (month - 0.5) * (x1 - x0) / 12
+
+    def to_y(value):
+        return y1 - (value - 1) * (y1 - y0) / 30
+
+    # Y-axis ticks and labels
+    for value in range(1, 32):
+        y = round(to_y(value))
+        draw.line([x0 - 4, y, x0, y], fill=0)
+        draw.text((x0 - 7, y), str(value), font=tick_font, fill=0, anchor='rm')
+
+    # X-axis ticks and month abbreviations
+    for month in range(1, 13):
+        x = round(to_x(month))
+        draw.line([x, y1, x, y1 + 4], fill=0)
+        draw.text((x, y1 + 8), calendar.month_abbr[month], font=month_font, fill=0, anchor='mt')
+
+    # Line and markers go on their own canvas so anything outside the y range is clipped like an axes
+    area = Image.new('1', (x1 - x0 + 1, y1 - y0 + 1), 255)
+    area_draw = ImageDraw.Draw(area)
+    points = [(to_x(month) - x0, to_y(count) - y0) for month, count in enumerate(days_count, start=1)]
+    area_draw.line(points, fill=0, width=2)
+    for x, y in points:
+        area_draw.ellipse([x - 4, y - 4, x + 4, y + 4], fill=0)
+    image.paste(area, (x0, y0))
+    draw.rectangle([x0, y0, x1, y1], outline=0)
+
+    # Data labels above each point (kept inside the chart for counts below the axis)
+    for month, count in enumerate(days_count, start=1):
+        y = min(to_y(count), y1) - 8
+        draw.text((to_x(month), y), str(count), font=tick_font, fill=0, anchor='mb')
+
+    return image
+
+# Threshold an image straight to 1-bit (no dithering)
+def to_1bit(image, threshold=128):
+    if image.mode == '1':
+        return image
+    return image.convert('L').point(lambda value: 255 if value >= threshold else 0, mode='1')
+
+# Function to generate the plot with matplotlib (optional fallback backend) as an in-memory 1-bit frame
+def render_plot_matplotlib(year, shape, months, days_count, width, height):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    # Size the figure so it renders at exactly the e-paper resolution
     dpi = 100  # Adjust DPI if necessary
-    fig_width = 960 / dpi  # 9.6 inches
-    fig_height = 680 / dpi  # 6.8 inches
+    fig_width = width / dpi  # 9.6 inches on the 960x680 panel
+    fig_height = height / dpi  # 6.8 inches
 
-    fig, ax = plt.subplots(figsize=(fig_width, fig_height), dpi=dpi)
+    fig = Figure(figsize=(fig_width, fig_height), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.subplots()
     fig.patch.set_facecolor('white')
     ax.set_facecolor('white')  # Ensure background is white
 
     # Adjust the plot area to leave room at the top
-    plt.subplots_adjust(top=0.85)  # Leave space at the top for the title and shapes
+    fig.subplots_adjust(top=0.85)  # Leave space at the top for the title and shapes
 
     # Set title
     fig.suptitle(f'{shapes[shape]} Shaded Days in {year}', fontsize=24, color='black', y=0.96)
@@ -91,20 +173,17 @@ def plot_year_data(epd, year, shape):
     ax.set_ylabel('')
 
     # Remove extra whitespace
-    plt.tight_layout()
-
-    # Save the plot as a .png image to display on the e-paper
-    plot_file = '/tmp/plot.png'
-    fig.savefig(plot_file, format='png', facecolor='white')
-    plt.close(fig)  # Close the figure after saving
+    fig.tight_layout()
 
-    # Load the image and display on the e-paper
-    display_plot_on_epaper(epd, plot_file)
-    plot_active = True    # Mark plot as active
-    first_plot = False    # Subsequent calls are not the first plot
+    # Rasterize in memory and threshold to 1-bit
+    canvas.draw()
+    image = Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+    return to_1bit(image)
 
-# Function to draw the shapes above the plot area using fig.transFigure
+# Function to draw the shapes above the plot area using fig.transFigure (matplotlib backend)
 def draw_shape_options(fig, current_shape):
+    from matplotlib.patches import Ellipse, Rectangle, Polygon
+
     # Define positions and sizes in figure coordinates (0 to 1)
     shape_positions = [0.83, 0.88, 0.93]  # Positions along x-axis
     y = 0.95  # Vertical position in figure coordinates
@@ -139,7 +218,7 @@ def draw_shape_options(fig, current_shape):
         fig.patches.append(shape)
 
 # Function to display the plot on the e-paper display
-def display_plot_on_epaper(epd, image_path):
+def display_plot_on_epaper(epd, image):
     global first_plot
     try:
         if first_plot:
@@ -150,17 +229,17 @@ def display_plot_on_epaper(epd, image_path):
         else:
             print("Updating plot without reinitializing the display.")
 
-        # Load and process the image
-        image = Image.open(image_path)
-        image = image.convert('1')
-        image = image.resize((epd.width, epd.height), Image.ANTIALIAS)
+        # Frames are rendered at panel resolution, so only make sure they are 1-bit
+        image = to_1bit(image)
+        if image.size != (epd.width, epd.height):
+            print(f"Plot frame is {image.size}, expected {(epd.width, epd.height)}.")
 
         # Use partial update if available
         if hasattr(epd, 'displayPartial'):
-            epd.displayPartial(epd.getbuffer(image))
+            epd.displayPartial(framebuffer.get_buffer(epd, image))
             print("Plot updated using partial update.")
         else:
-            epd.display(epd.getbuffer(image))
+            epd.display(framebuffer.get_buffer(epd, image))
             print("Plot updated without reinitializing.")
 
     except Exception as e:
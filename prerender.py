@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+from compositor import render_frame
+import metrics
+
+# How many prerendered frames (image + packed buffer, ~160 KB each) to keep
+PRERENDER_CACHE_SIZE = 4
+# Wait for this long without new requests before rendering, so a burst of arrow
+# presses doesn't keep the CPU busy with frames nobody will look at
+QUIET_DELAY = 1.0  # seconds
+
+
+# Bounded cache of finished calendar frames.
+# A frame is keyed by everything it was drawn from, including the repository's
+# version of the year, so a toggle on a cached year makes its frame miss.
+class FrameCache:
+    def __init__(self, size=PRERENDER_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.frames = OrderedDict()  # year -> (key, image, buffer)
+
+    # (image, buffer) for the key, or None
+    def get(self, key):
+        with self.lock:
+            entry = self.frames.get(key[0])
+            if entry is None or entry[0] != key:
+                return None
+            self.frames.move_to_end(key[0])
+            return entry[1], entry[2]
+
+    def contains(self, key):
+        with self.lock:
+            entry = self.frames.get(key[0])
+            return entry is not None and entry[0] == key
+
+    # Keep one frame per year, dropping the least recently used years
+    def put(self, key, image, buffer):
+        with self.lock:
+            self.frames[key[0]] = (key, image, buffer)
+            self.frames.move_to_end(key[0])
+            while len(self.frames) > self.size:
+                self.frames.popitem(last=False)
+
+    def discard(self, year):
+        with self.lock:
+            self.frames.pop(year, None)
+
+
+# Cache key of a calendar frame
+def frame_key(year, version, shape, selected_day, today):
+    return (year, version, shape, selected_day, today)
+
+
+# Background thread that renders calendar frames for years the user is likely to
+# flip to next (the ones either side of the current year), so pressing 'a' or 'd'
+# only has to push a finished buffer.
+class Prerenderer(threading.Thread):
+    def __init__(self, repository, width, height, getbuffer, quiet_delay=QUIET_DELAY):
+        super().__init__(name='prerender', daemon=True)
+        self.repository = repository
+        self.width = width
+        self.height = height
+        self.getbuffer = getbuffer  # Packs an image into the panel's byte layout
+        self.quiet_delay = quiet_delay
+        self.cache = FrameCache()
+        self.condition = threading.Condition()
+        self.request = None  # [(year, shape, selected_day, today), ...] to prerender next
+        self.stopping = False
+
+    # Prerender frames given as (year, shape, selected_day, today), replacing any request not yet started
+    def prefetch(self, frames):
+        with self.condition:
+            self.request = list(frames)
+            self.condition.notify_all()
+
+    # Finished (image, buffer) for the frame, or None
+    def lookup(self, year, version, shape, selected_day, today):
+        return self.cache.get(frame_key(year, version, shape, selected_day, today))
+
+    # Drop a year's frame (its data changed)
+    def discard(self, year):
+        self.cache.discard(year)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.request is None and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    break
+
+                # Only start once the requests have settled
+                request = None
+                while self.request is not request and not self.stopping:
+                    request = self.request
+                    self.condition.wait(self.quiet_delay)
+                if self.stopping:
+                    break
+                self.request = None
+
+            for year, shape, selected_day, today in request:
+                try:
+                    self._render(year, shape, selected_day, today)
+                except Exception as e:
+                    print(f"Error prerendering {year}: {e}")
+
+    def _render(self, year, shape, selected_day, today):
+        version, shaded_days = self.repository.peek(year)  # Reads the year without creating its file
+        key = frame_key(year, version, shape, selected_day, today)
+        if self.cache.contains(key):
+            return
+
+        with metrics.span('prerender'):
+            image = render_frame(year, self.width, self.height, shaded_days, shape, selected_day, today)
+            buffer = self.getbuffer(image)
+        self.cache.put(key, image, buffer)
+
+    def stop(self, timeout=5):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join(timeout)
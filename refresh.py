@@ -0,0 +1,193 @@
+import os
+from collections import namedtuple
+import framebuffer
+import metrics
+
+# Fall back to a full refresh when the changed regions cover more than this fraction of the panel
+FULL_REFRESH_RATIO = float(os.environ.get('CALENDAR_FULL_REFRESH_RATIO', '0.35'))
+# Changed rows closer together than this are pushed as one region
+MERGE_GAP = 16
+# More regions than this are pushed as their combined bounding box (each partial refresh has a fixed cost)
+MAX_REGIONS = 4
+
+# What changed between two packed frames:
+#   changed_bytes - number of bytes that differ
+#   box           - (x0, y0, x1, y1) exclusive box around every change, None if nothing changed
+#   regions       - byte-aligned boxes to push as partial refreshes
+FrameDiff = namedtuple('FrameDiff', ['changed_bytes', 'box', 'regions'])
+
+
+# Compare two frames packed in the panel's layout (see framebuffer.py): XOR them,
+# find the rows that changed, group rows closer than merge_gap into bands and give
+# each band its tight column extent
+def diff_buffers(old, new, width, height, merge_gap=MERGE_GAP, max_regions=MAX_REGIONS):
+    row_bytes = width // 8
+    np = framebuffer.np
+
+    # Changed rows as (row, first byte, last byte + 1)
+    if np is not None:
+        xor = np.bitwise_xor(np.frombuffer(old, dtype=np.uint8), np.frombuffer(new, dtype=np.uint8))
+        xor = xor.reshape(height, row_bytes)
+        changed_bytes = int(np.count_nonzero(xor))
+        if not changed_bytes:
+            return FrameDiff(0, None, [])
+        rows = np.flatnonzero(xor.any(axis=1))
+        columns = xor[rows] != 0
+        firsts = columns.argmax(axis=1)
+        lasts = row_bytes - columns[:, ::-1].argmax(axis=1)
+        changed_rows = zip(rows.tolist(), firsts.tolist(), lasts.tolist())
+    else:
+        changed_bytes = 0
+        changed_rows = []
+        for row in range(height):
+            start = row * row_bytes
+            old_row, new_row = old[start:start + row_bytes], new[start:start + row_bytes]
+            if old_row == new_row:
+                continue
+            differing = [i for i in range(row_bytes) if old_row[i] != new_row[i]]
+            changed_bytes += len(differing)
+            changed_rows.append((row, differing[0], differing[-1] + 1))
+        if not changed_rows:
+            return FrameDiff(0, None, [])
+
+    bands = []
+    for row, first, last in changed_rows:
+        if bands and row - bands[-1][3] < merge_gap:
+            x0, y0, x1, _ = bands[-1]
+            bands[-1] = [min(x0, first), y0, max(x1, last), row + 1]
+        else:
+            bands.append([first, row, last, row + 1])
+
+    regions = [(x0 * 8, y0, x1 * 8, y1) for x0, y0, x1, y1 in bands]
+    box = (min(r[0] for r in regions), regions[0][1], max(r[2] for r in regions), regions[-1][3])
+    if len(regions) > max_regions:
+        regions = [box]
+    return FrameDiff(changed_bytes, box, regions)
+
+
+# Merge overlapping regions (neighbouring cells share a border pixel) until none overlap;
+# more than max_regions are pushed as their combined bounding box
+def merge_regions(regions, max_regions=MAX_REGIONS):
+    merged = []
+    for x0, y0, x1, y1 in regions:
+        while True:  # A grown region can reach regions it didn't overlap before
+            overlapping = [r for r in merged if x0 < r[2] and r[0] < x1 and y0 < r[3] and r[1] < y1]
+            if not overlapping:
+                break
+            for r in overlapping:
+                merged.remove(r)
+                x0, y0, x1, y1 = min(x0, r[0]), min(y0, r[1]), max(x1, r[2]), max(y1, r[3])
+        merged.append((x0, y0, x1, y1))
+    if len(merged) > max_regions:
+        merged = [(min(r[0] for r in merged), min(r[1] for r in merged),
+                   max(r[2] for r in merged), max(r[3] for r in merged))]
+    return merged
+
+
+# Refresh policy: 'skip' when nothing changed, 'full' when the regions to push cover
+# more than full_refresh_ratio of the panel, 'partial' otherwise
+def choose_refresh(diff, width, height, full_refresh_ratio=FULL_REFRESH_RATIO):
+    if not diff.changed_bytes:
+        return 'skip'
+    changed_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in diff.regions)
+    if changed_area > full_refresh_ratio * width * height:
+        return 'full'
+    return 'partial'
+
+
+# Keeps the last frame pushed to the panel and only sends what changed
+class RefreshEngine:
+    def __init__(self, epd, full_refresh_ratio=FULL_REFRESH_RATIO):
+        self.epd = epd
+        self.full_refresh_ratio = full_refresh_ratio
+        self.last_buffer = None  # Last frame pushed to the panel, packed
+        self.last_source = None  # What the last frame was a version of (see push_region)
+        self.mode = 'full'  # Refresh mode the controller is currently initialised for
+        self.partials_since_full = 0  # Ghosting builds up with every partial refresh
+        self.full_requested = False
+
+    # Make the next push a full refresh (clears ghosting)
+    def request_full(self):
+        self.full_requested = True
+
+    def _full_refresh(self, buffer):
+        if self.mode != 'full':
+            self.epd.init()
+            self.mode = 'full'
+        self.partials_since_full = 0
+        self.full_requested = False
+        self.epd.display(buffer)
+        print("Full refresh performed.")
+        return 'full'
+
+    def _partial_refresh(self, buffer, regions):
+        if self.mode != 'partial':
+            self.epd.init_Part()
+            self.mode = 'partial'
+        for x0, y0, x1, y1 in regions:
+            self.epd.display_Partial(buffer, x0, y0, x1, y1)
+        self.partials_since_full += 1
+        print(f"Partial refresh of {len(regions)} region(s): {regions}")
+        return 'partial'
+
+    # Push a new frame, choosing between skipping, a partial refresh and a full refresh.
+    # `buffer` is the frame already packed for the panel (e.g. prerendered), if there is one;
+    # with a buffer the image can be None. `source` identifies the frame for push_region.
+    def push(self, image, force_full=False, buffer=None, source=None):
+        if buffer is None:
+            with metrics.span('getbuffer'):
+                buffer = framebuffer.get_buffer(self.epd, image)
+        if isinstance(buffer, list):
+            buffer = bytearray(buffer)  # The driver's getbuffer can hand back a list
+        # Until this push succeeds, don't trust the panel to hold a version of any source:
+        # if the driver raises, the next push_region has to diff the whole frame
+        self.last_source = None
+
+        if force_full or self.full_requested or self.last_buffer is None or len(self.last_buffer) != len(buffer):
+            result = self._full_refresh(buffer)
+        else:
+            width, height = self.epd.width, self.epd.height
+            with metrics.span('diff'):
+                diff = diff_buffers(self.last_buffer, buffer, width, height)
+            result = choose_refresh(diff, width, height, self.full_refresh_ratio)
+            if result == 'skip':
+                print("Frame unchanged, skipping refresh.")
+            elif result == 'full':
+                self._full_refresh(buffer)
+            else:
+                self._partial_refresh(buffer, diff.regions)
+
+        if result != 'skip':
+            self.last_buffer = bytearray(buffer)
+        self.last_source = source
+        return result
+
+    # Push a frame of which only `boxes` can have changed since the last push of the same
+    # source (a frame being repainted cell by cell): refresh just those boxes, each as its
+    # own region, without diffing the rest of the panel. Anything else goes through push().
+    def push_region(self, buffer, boxes, source):
+        if (source is None or source != self.last_source or self.full_requested
+                or self.last_buffer is None or len(self.last_buffer) != len(buffer)):
+            return self.push(None, buffer=buffer, source=source)
+
+        width, height = self.epd.width, self.epd.height
+        regions = merge_regions([framebuffer.align_box(box, width, height) for box in boxes])
+        if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions) > self.full_refresh_ratio * width * height:
+            return self.push(None, buffer=buffer, source=source)
+
+        # Compare and copy only the rows and bytes inside the regions
+        row_bytes = width // 8
+        rows = [slice(y * row_bytes + x0 // 8, y * row_bytes + x1 // 8)
+                for x0, y0, x1, y1 in regions for y in range(y0, y1)]
+        if all(self.last_buffer[row] == buffer[row] for row in rows):
+            print("Frame unchanged, skipping refresh.")
+            return 'skip'
+
+        # A failed refresh loses the boxes (frame() has handed them out), so make the next
+        # push diff the whole frame instead
+        self.last_source = None
+        result = self._partial_refresh(buffer, regions)
+        for row in rows:
+            self.last_buffer[row] = buffer[row]
+        self.last_source = source
+        return result
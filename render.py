@@ -0,0 +1,179 @@
+from functools import lru_cache
+from PIL import Image, ImageDraw
+from layout import get_layout, DayCell, SHAPE_DIAMETER
+from glyphs import get_atlases, ink_mask, MARGIN
+import metrics
+
+# How many static year templates to keep around
+BASE_LAYER_CACHE_SIZE = 4
+
+
+# Function to render the shapes in a row in the top right corner
+def draw_shape_options(draw, shape_x, shape_y, current_shape):
+    # Adjusted for more spacing between the shapes and moved further to the right
+    shape_spacing = 50  # Spacing between shapes
+
+    # Display shapes in a single row with even spacing
+    draw.ellipse([shape_x, shape_y, shape_x + 20, shape_y + 20], fill=0 if current_shape == 1 else None, outline=0)
+    draw.rectangle([shape_x + shape_spacing, shape_y, shape_x + shape_spacing + 20, shape_y + 20], fill=0 if current_shape == 2 else None, outline=0)
+    draw.polygon([shape_x + 2 * shape_spacing, shape_y + 20, shape_x + 2 * shape_spacing + 10, shape_y, shape_x + 2 * shape_spacing + 20, shape_y + 20], fill=0 if current_shape == 3 else None, outline=0)
+
+
+# Render the parts of the year that never change between redraws:
+# the year header, weekday row, month labels and every day number
+@lru_cache(maxsize=BASE_LAYER_CACHE_SIZE)
+def get_base_layer(year, width, height):
+    layout = get_layout(year, width, height)
+    large_glyphs, small_glyphs = get_atlases()  # Text is pasted from prerasterized masks
+
+    image = Image.new('1', (width, height), 255)  # 255 means white background
+
+    # Draw the year header at the top
+    large_glyphs.paste(image, layout.header_origin, layout.header_text)
+
+    # Weekday labels, centered above the corresponding days
+    for origin, label in layout.weekday_labels:
+        small_glyphs.paste(image, origin, label)
+
+    # Month labels aligned with the day numbers
+    for origin, month_name in layout.month_labels:
+        small_glyphs.paste(image, origin, month_name)
+
+    # Day numbers
+    for cell in layout.cells.values():
+        small_glyphs.paste(image, cell.text_origin, cell.text)
+
+    return image
+
+
+# Draw a day's shape (circle, square or triangle) filled or as the selection ring
+def draw_day_shape(draw, cell, shape, ring=False):
+    shape_x, shape_y, shape_x_end, shape_y_end = cell.shape_box
+    triangle = [shape_x, shape_y_end, shape_x + SHAPE_DIAMETER / 2, shape_y, shape_x_end, shape_y_end]
+
+    if ring:
+        if shape == 1:  # Circle
+            draw.ellipse(cell.ring_box, outline=0, width=2)
+        elif shape == 2:  # Square
+            draw.rectangle(cell.ring_box, outline=0, width=2)
+        elif shape == 3:  # Triangle
+            draw.polygon(triangle, outline=0, width=2)
+    else:
+        if shape == 1:  # Circle
+            draw.ellipse(cell.shape_box, fill=0)
+        elif shape == 2:  # Square
+            draw.rectangle(cell.shape_box, fill=0)
+        elif shape == 3:  # Triangle
+            draw.polygon(triangle, fill=0)
+
+
+# Mask of a day shape (filled, or the selection ring) drawn once and pasted from then on.
+# Keyed by the size of the shape box and how far the ring box reaches past it, so the
+# same stamps serve every year and panel layout. Returns (mask, offset from the shape box).
+@lru_cache(maxsize=None)
+def get_shape_stamp(shape, ring, shape_size, ring_margins):
+    width, height = shape_size
+    left, top, right, bottom = ring_margins
+    x, y = MARGIN + left, MARGIN + top
+    shape_box = (x, y, x + width, y + height)
+    ring_box = (x - left, y - top, x + width + right, y + height + bottom)
+
+    canvas = Image.new('1', (width + left + right + 2 * MARGIN, height + top + bottom + 2 * MARGIN), 255)
+    draw_day_shape(ImageDraw.Draw(canvas), DayCell(0, 0, '', None, None, shape_box, ring_box, None), shape, ring)
+    return ink_mask(canvas, (x, y))
+
+
+# Paste a day's shape, like draw_day_shape but from the stamp cache
+def stamp_day_shape(image, cell, shape, ring=False):
+    shape_x, shape_y, shape_x_end, shape_y_end = cell.shape_box
+    ring_x, ring_y, ring_x_end, ring_y_end = cell.ring_box
+    stamp = get_shape_stamp(shape, ring, (shape_x_end - shape_x, shape_y_end - shape_y),
+                            (shape_x - ring_x, shape_y - ring_y, ring_x_end - shape_x_end, ring_y_end - shape_y_end))
+    if stamp is not None:
+        mask, (dx, dy) = stamp
+        image.paste(0, (shape_x + dx, shape_y + dy), mask)
+
+
+# Mask of the shape options row with the current shape filled in
+@lru_cache(maxsize=None)
+def get_shape_options_stamp(current_shape):
+    canvas = Image.new('1', (2 * 50 + 20 + 1 + 2 * MARGIN, 20 + 1 + 2 * MARGIN), 255)
+    draw_shape_options(ImageDraw.Draw(canvas), MARGIN, MARGIN, current_shape)
+    return ink_mask(canvas, (MARGIN, MARGIN))
+
+
+def stamp_shape_options(image, origin, current_shape):
+    mask, (dx, dy) = get_shape_options_stamp(current_shape)
+    image.paste(0, (origin[0] + dx, origin[1] + dy), mask)
+
+
+# Render a full calendar frame: a copy of the static year template with the
+# shape options, today underline, selection ring and shaded days drawn on top.
+# Everything is drawn in black, so the overlay order doesn't change the result.
+#   selected_day - (month, day) with the selection ring, or None when hidden
+#   today        - (month, day) to underline, or None
+def render_calendar_image(year, width, height, shaded_days, current_shape, selected_day=None, today=None):
+    with metrics.span('layout'):
+        layout = get_layout(year, width, height)
+
+    with metrics.span('paint'):
+        image = get_base_layer(year, width, height).copy()
+        paint_overlay(image, layout, shaded_days, current_shape, selected_day, today)
+    return image
+
+
+# Draw the marks that change between redraws onto a copy of the year template
+def paint_overlay(image, layout, shaded_days, current_shape, selected_day, today):
+    # Draw shape options in a row at the top right
+    stamp_shape_options(image, layout.shape_options_origin, current_shape)
+
+    # Underline the current day (fixed underline)
+    if today in layout.cells:
+        ImageDraw.Draw(image).line(layout.cells[today].underline, fill=0, width=2)
+
+    # Draw the selection shape if the ring is visible
+    if selected_day in layout.cells:
+        stamp_day_shape(image, layout.cells[selected_day], current_shape, ring=True)
+
+    # Stamp a shaded shape on each day shaded with the current shape
+    for day, shape in shaded_days.items():
+        if shape == current_shape and day in layout.cells:
+            stamp_day_shape(image, layout.cells[day], shape)
+
+    return image
+
+
+# True if two exclusive boxes overlap
+def boxes_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+# Redraw some day cells of an existing frame in place: restore their boxes from the
+# year template, then draw every mark that touches them again. Cells overlap their
+# neighbours by a pixel, so the neighbours' marks are redrawn too; they are black like
+# everything else, so drawing them over themselves changes nothing.
+# Returns the boxes of the repainted cells (empty if none were).
+def repaint_cells(image, layout, days, shaded_days, current_shape, selected_day=None, today=None):
+    boxes = [layout.cells[day].box for day in days if day in layout.cells]
+    if not boxes:
+        return []
+
+    base = get_base_layer(layout.year, layout.width, layout.height)
+    for box in boxes:
+        image.paste(base.crop(box), box[:2])
+
+    def touched(box):
+        return any(boxes_overlap(box, repainted) for repainted in boxes)
+
+    with metrics.span('paint'):
+        if touched(layout.shape_options_box):
+            stamp_shape_options(image, layout.shape_options_origin, current_shape)
+        if today in layout.cells and touched(layout.cells[today].box):
+            ImageDraw.Draw(image).line(layout.cells[today].underline, fill=0, width=2)
+        if selected_day in layout.cells and touched(layout.cells[selected_day].box):
+            stamp_day_shape(image, layout.cells[selected_day], current_shape, ring=True)
+        for day, shape in shaded_days.items():
+            if shape == current_shape and day in layout.cells and touched(layout.cells[day].box):
+                stamp_day_shape(image, layout.cells[day], shape)
+
+    return boxes
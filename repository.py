@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+import storage
+
+# Shape types: 1 = circle, 2 = square, 3 = triangle
+SHAPES = (1, 2, 3)
+# How many years read ahead by peek (and not loaded yet) to keep
+PEEK_CACHE_SIZE = 4
+
+
+# Single owner of the shaded-day data, shared by the calendar and plot views.
+# Keeps a per-(month, shape) counter for every loaded year so the plot never has
+# to re-read or re-count anything, and sends every change to the persistence worker.
+class ShadedDaysRepository:
+    def __init__(self, persistence_worker):
+        self.persistence = persistence_worker
+        self.lock = threading.RLock()
+        self.years = {}  # year -> {(month, day): shape}
+        self.counts = {}  # year -> {(month, shape): number of days}
+        self.versions = {}  # year -> number of changes made since it was loaded
+        self.peeked = OrderedDict()  # year -> (file exists, {(month, day): shape}) read by peek, not loaded yet
+
+    # Load a year from disk (plus anything still waiting to be written) the first time it is used
+    def load(self, year):
+        with self.lock:
+            if year in self.years:
+                return self.years[year]
+
+            if year in self.peeked:
+                file_exists, shaded_days = self.peeked.pop(year)  # Read ahead in the background
+            else:
+                file_exists = storage.year_exists(year)
+                shaded_days = storage.load_year(year) if file_exists else {}
+            self.persistence.overlay(year, shaded_days)  # Changes still waiting to be written
+            if file_exists:
+                print(f"Shaded days loaded for {year}")
+            else:
+                print(f"No file found for {year}. Creating new file...")
+                self.persistence.save_snapshot(year, shaded_days)
+
+            counts = {}
+            for (month, day), shape in shaded_days.items():
+                counts[(month, shape)] = counts.get((month, shape), 0) + 1
+
+            self.years[year] = shaded_days
+            self.counts[year] = counts
+            self.versions[year] = 0
+            return shaded_days
+
+    # Version and a copy of the year's data, taken together so they always match
+    def snapshot(self, year):
+        with self.lock:
+            shaded_days = self.load(year)
+            return self.versions[year], dict(shaded_days)
+
+    # Like snapshot, but a year that isn't loaded yet is only read ahead, not loaded: no file
+    # is created for it, and the data is kept aside until load() takes it. For speculative
+    # readers like the prerenderer, so a year switch doesn't have to read the disk.
+    # The version matches what snapshot gives once the year is loaded for real.
+    def peek(self, year):
+        with self.lock:
+            if year in self.years:
+                return self.versions[year], dict(self.years[year])
+            if year in self.peeked:
+                return 0, dict(self.peeked[year][1])
+
+        # Read outside the lock so the Tk thread isn't held up by the disk
+        file_exists = storage.year_exists(year)
+        shaded_days = storage.load_year(year) if file_exists else {}
+
+        with self.lock:
+            if year in self.years:
+                return self.versions[year], dict(self.years[year])
+            self.persistence.overlay(year, shaded_days)
+            self.peeked[year] = (file_exists, shaded_days)
+            while len(self.peeked) > PEEK_CACHE_SIZE:
+                self.peeked.popitem(last=False)
+            return 0, dict(shaded_days)
+
+    # Shade the day with the shape, or clear it if it already has that shape; returns the new shape or None
+    def toggle(self, year, month, day, shape):
+        with self.lock:
+            shaded_days = self.load(year)
+            counts = self.counts[year]
+
+            old_shape = shaded_days.get((month, day))
+            if old_shape is not None:
+                counts[(month, old_shape)] -= 1
+
+            if old_shape == shape:
+                del shaded_days[(month, day)]
+                new_shape = None
+            else:
+                shaded_days[(month, day)] = shape
+                counts[(month, shape)] = counts.get((month, shape), 0) + 1
+                new_shape = shape
+
+            self.versions[year] += 1
+
+        self.persistence.notify(year, month, day, new_shape)
+        return new_shape
+
+    # Number of days shaded with the shape in each month (January first)
+    def monthly_counts(self, year, shape):
+        with self.lock:
+            self.load(year)
+            counts = self.counts[year]
+            return [counts.get((month, shape), 0) for month in range(1, 13)]
@@ -0,0 +1,98 @@
+import metrics
+
+# Partial refreshes leave ghosting behind; after this many, clear it with a full refresh
+GHOST_CLEAR_AFTER = 20
+# ...once nothing has happened for this long (ms)
+QUIET_PERIOD_MS = 15000
+# How often to check whether the display worker has finished (ms)
+POLL_MS = 50
+
+
+# Decides when the panel is redrawn.
+# A request on an idle panel renders as soon as Tk is idle (after the key handlers
+# that are already queued have run). The render callback snapshots the state on the
+# Tk thread and returns a job that draws and pushes it; with a display worker the job
+# runs there, and requests that arrive while a refresh is in progress replace the
+# queued job, so they coalesce into one follow-up frame. A ghost-clearing full
+# refresh is scheduled at a quiet moment once enough partial refreshes have piled up.
+# Work that must come after the pending refreshes (putting the panel to sleep) waits
+# in when_idle until the panel has caught up.
+class RefreshScheduler:
+    def __init__(self, root, render, engine, worker=None):
+        self.root = root
+        self.render = render  # Returns a job that draws and pushes the current state (or None)
+        self.engine = engine  # RefreshEngine, counts partial refreshes since the last full one
+        self.worker = worker  # DisplayWorker; without one, jobs run on the Tk thread
+        self.busy = False  # A refresh is in progress
+        self.scheduled_id = None
+        self.poll_id = None
+        self.ghost_timer_id = None
+        self.idle_callbacks = []  # Run once nothing is scheduled or in progress
+
+    # Ask for the current state to be shown
+    def request(self):
+        self.cancel_ghost_clear()
+        if self.scheduled_id is None:
+            self.scheduled_id = self.root.after_idle(self._run)
+
+    def _run(self):
+        self.scheduled_id = None
+        metrics.mark("refresh fired")
+        job = self.render()
+        if job is None:
+            self._run_idle_callbacks()
+            return
+
+        self.busy = True
+        if self.worker is None:
+            try:
+                job()
+            finally:
+                self.done()
+        else:
+            self.worker.submit(job)
+            if self.poll_id is None:
+                self.poll_id = self.root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        self.poll_id = None
+        if self.worker.idle():
+            self.done()
+        else:
+            self.poll_id = self.root.after(POLL_MS, self._poll)
+
+    # Called once the panel has caught up with the latest request
+    def done(self):
+        self.busy = False
+        self._schedule_ghost_clear()
+        self._run_idle_callbacks()
+
+    # Call back on the Tk thread once every refresh requested so far has been pushed
+    def when_idle(self, callback):
+        self.idle_callbacks.append(callback)
+        self._run_idle_callbacks()
+
+    def _run_idle_callbacks(self):
+        if self.busy or self.scheduled_id is not None:
+            return
+        callbacks, self.idle_callbacks = self.idle_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _schedule_ghost_clear(self):
+        if self.engine.partials_since_full >= GHOST_CLEAR_AFTER and self.ghost_timer_id is None:
+            self.ghost_timer_id = self.root.after(QUIET_PERIOD_MS, self._ghost_clear)
+
+    def _ghost_clear(self):
+        self.ghost_timer_id = None
+        if self.busy or self.scheduled_id is not None:
+            return  # Activity resumed; try again after it settles
+        print(f"Clearing ghosting after {self.engine.partials_since_full} partial refreshes.")
+        self.engine.request_full()
+        self.request()
+
+    # Drop a pending ghost-clearing refresh (activity, or the panel is going to sleep)
+    def cancel_ghost_clear(self):
+        if self.ghost_timer_id is not None:
+            self.root.after_cancel(self.ghost_timer_id)
+            self.ghost_timer_id = None
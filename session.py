@@ -0,0 +1,45 @@
+import time
+import metrics
+
+
+# Tracks whether the panel is powered up and brings it back from sleep cheaply.
+# E-paper keeps its image without power, and the refresh engine keeps the last frame
+# it pushed, so waking needs neither a new driver object nor a full init: the engine
+# is told the controller must be re-armed, and its next push runs init_Part (or init,
+# if the frame changed too much) and refreshes only what changed while asleep.
+# Lives on the display worker.
+class DisplaySession:
+    def __init__(self, epd, engine):
+        self.epd = epd
+        self.engine = engine
+        self.asleep = False
+        self.slept_at = None
+        self.wake_started = None  # Set from a wake until the first update after it
+
+    # Power the panel down
+    def sleep(self):
+        if self.asleep or self.epd is None:
+            return
+        self.epd.sleep()
+        self.engine.mode = None  # The controller needs an init before the next refresh
+        self.asleep = True
+        self.slept_at = time.perf_counter()
+
+    # Mark the panel as awake; the controller is re-armed by the next push
+    def wake(self):
+        if not self.asleep:
+            return False
+        print(f"Waking up e-paper display after {time.perf_counter() - self.slept_at:.0f} s asleep...")
+        metrics.mark("wake")
+        self.asleep = False
+        self.wake_started = time.perf_counter()
+        return True
+
+    # Call after each push: reports the wake-to-first-update latency once per wake
+    def updated(self):
+        if self.wake_started is None:
+            return
+        latency = time.perf_counter() - self.wake_started
+        metrics.record('wake_to_update', self.wake_started, latency)
+        print(f"First update after waking took {latency * 1000:.0f} ms.")
+        self.wake_started = None
@@ -0,0 +1,225 @@
+import os
+
+# Directory to store the calendar data
+DATA_DIR = '/home/admin/CalendarDatabase'
+
+# Storage format: 'text' ({year}.txt snapshot + journal) or 'bitset' (packed binary store, see bitstore.py).
+# The bitset store covers a fixed range of years; years outside it are kept in text files.
+STORE_FORMAT = os.environ.get('CALENDAR_STORE', 'text')
+
+# Fold the journal into the snapshot file once it holds this many records
+COMPACT_AFTER = 64
+
+# Number of journal records currently on disk for each year (kept by the writer)
+journal_lengths = {}
+
+
+# The binary store, opened on first use (bitstore imports this module, so import it lazily)
+def bit_store():
+    import bitstore
+    return bitstore.get_store()
+
+
+# True if the year is kept in the binary store
+def in_bit_store(year):
+    return STORE_FORMAT == 'bitset' and bit_store().covers(year)
+
+
+# Snapshot file with one "month,day,shape" line per shaded day
+def snapshot_path(year):
+    return os.path.join(DATA_DIR, f'{year}.txt')
+
+
+# Append-only journal of changes made since the last snapshot
+def journal_path(year):
+    return os.path.join(DATA_DIR, f'{year}.journal')
+
+
+# Parse the snapshot file (the 2-column legacy format defaults to circle)
+def read_snapshot(year):
+    shaded_days = {}
+    file_path = snapshot_path(year)
+    if not os.path.exists(file_path):
+        return shaded_days
+
+    with open(file_path, 'r') as file:
+        for line in file:
+            values = line.strip().split(',')
+            try:
+                if len(values) == 3:  # New format with month, day, and shape
+                    month, day, shape = map(int, values)
+                elif len(values) == 2:  # Old format with just month and day, default to circle (1)
+                    month, day = map(int, values)
+                    shape = 1  # Default to circle
+                else:
+                    continue  # Skip lines that don't match the expected format
+            except ValueError:
+                continue
+            shaded_days[(month, day)] = shape
+    return shaded_days
+
+
+# Rewrite the snapshot file: write a temp file, fsync it, then rename it over the old one
+def write_snapshot(year, shaded_days):
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+
+    file_path = snapshot_path(year)
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        for (month, day), shape in sorted(shaded_days.items()):
+            file.write(f'{month},{day},{shape}\n')
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+    sync_directory()
+
+
+# Make a rename or delete in the data directory durable
+def sync_directory():
+    try:
+        dir_fd = os.open(DATA_DIR, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+# Apply the journal records on top of the snapshot; returns how many records were read.
+# A record only counts once its newline is on disk: a crash mid-append can leave a prefix
+# like "C,1,3" of "C,1,31" that would otherwise parse as a different, valid record.
+def replay_journal(year, shaded_days):
+    file_path = journal_path(year)
+    if not os.path.exists(file_path):
+        return 0
+
+    count = 0
+    with open(file_path, 'r') as file:
+        for line in file:
+            if not line.endswith('\n'):
+                continue  # Torn last record
+            values = line.strip().split(',')
+            try:
+                if values[0] == 'S' and len(values) == 4:  # Set: S,month,day,shape
+                    month, day, shape = map(int, values[1:])
+                    shaded_days[(month, day)] = shape
+                elif values[0] == 'C' and len(values) == 3:  # Clear: C,month,day
+                    month, day = map(int, values[1:])
+                    shaded_days.pop((month, day), None)
+                else:
+                    continue  # Skip torn or unknown records
+            except ValueError:
+                continue
+            count += 1
+    return count
+
+
+# Number of records in a year's journal (counted from disk the first time)
+def journal_length(year):
+    if year not in journal_lengths:
+        count = 0
+        if os.path.exists(journal_path(year)):
+            with open(journal_path(year), 'r') as file:
+                count = sum(1 for line in file if line.endswith('\n'))
+        journal_lengths[year] = count
+    return journal_lengths[year]
+
+
+# Cut a torn last record (no newline, left by a crash mid-append) off the journal, so the
+# next append starts on a line of its own instead of running on from the torn one
+def trim_torn_record(year):
+    file_path = journal_path(year)
+    if not os.path.exists(file_path):
+        return
+
+    with open(file_path, 'rb+') as file:
+        file.seek(0, os.SEEK_END)
+        if file.tell() == 0:
+            return
+        file.seek(-1, os.SEEK_END)
+        if file.read(1) == b'\n':
+            return
+        file.seek(0)
+        data = file.read()  # Small: the journal is compacted every COMPACT_AFTER records
+        file.truncate(data.rfind(b'\n') + 1)
+        file.flush()
+        os.fsync(file.fileno())
+    print(f"Dropped a torn record from {file_path}")
+
+
+# Write the current state as the new snapshot and start an empty journal.
+# Journal records hold absolute values, so replaying a journal that survived
+# a crash between these two steps gives the same result.
+def compact(year, shaded_days=None):
+    if in_bit_store(year):
+        if shaded_days is not None:
+            store = bit_store()
+            store.write_year(year, shaded_days)
+            store.flush()
+        return
+
+    if shaded_days is None:
+        shaded_days = load_text_year(year)
+    write_snapshot(year, shaded_days)
+    if os.path.exists(journal_path(year)):
+        os.remove(journal_path(year))
+        sync_directory()
+    journal_lengths[year] = 0
+
+
+# Load a year from the text files: the snapshot plus every change recorded in the journal since
+def load_text_year(year):
+    shaded_days = read_snapshot(year)
+    replay_journal(year, shaded_days)
+    return shaded_days
+
+
+# Load a year in whichever format is configured
+def load_year(year):
+    if in_bit_store(year):
+        return bit_store().load_year(year)
+    return load_text_year(year)
+
+
+# True if any data has been saved for the year
+def year_exists(year):
+    if in_bit_store(year):
+        return bit_store().has_year(year)
+    return os.path.exists(snapshot_path(year)) or os.path.exists(journal_path(year))
+
+
+# Append a batch of changes ({(month, day): shape or None}) to the journal in one write
+def append_changes(year, changes):
+    if not changes:
+        return
+
+    # In the binary store a change is just flipping the day's bits in the mapped file
+    if in_bit_store(year):
+        store = bit_store()
+        for (month, day), shape in changes.items():
+            store.set_day(year, month, day, shape)
+        store.flush()
+        return
+
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+
+    records = []
+    for (month, day), shape in sorted(changes.items()):
+        records.append(f'S,{month},{day},{shape}\n' if shape is not None else f'C,{month},{day}\n')
+
+    trim_torn_record(year)
+    count = journal_length(year)
+    with open(journal_path(year), 'a') as file:
+        file.write(''.join(records))
+        file.flush()
+        os.fsync(file.fileno())
+    journal_lengths[year] = count + len(records)
+
+    if journal_lengths[year] >= COMPACT_AFTER:
+        compact(year)
+        print(f"Journal for {year} compacted into {snapshot_path(year)}")